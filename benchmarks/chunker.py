@@ -0,0 +1,74 @@
+#!/usr/bin/python3.5
+# Message chunker benchmark
+# Builds a synthetic world, renders it with root_entity.to_string() like !world does,
+# and times splitting the output into discord sized messages,
+# first the way DiscordChannelInterface.print used to and then with split_message
+#
+# Usage: python3 benchmarks/chunker.py {number of things}
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bot
+
+things_per_fridge = 200
+old_max_characters = 200000 # the old way is quadratic, so it only gets the start of the output
+
+# how print used to split messages, collecting the pieces instead of sending them
+def old_split(message, pieces):
+	if len(message) > bot.max_message_length:
+		first = message
+		rest = ""
+		while len(first) > bot.max_message_length:
+			first, last = first.rsplit("\n", 1)
+			rest = "\n" + last + rest
+		pieces.append(first)
+		old_split(rest[1:], pieces)
+	else:
+		pieces.append(message)
+
+def build_world(things):
+	root = bot.Entity("Fridgeverse")
+	fridge = None
+	for i in range(things):
+		if i % things_per_fridge == 0:
+			fridge = bot.Entity("fridge " + str(i))
+			fridge.max_contents = things_per_fridge
+			root.add_content(fridge)
+		fridge.add_content(bot.Entity("thing " + str(i)))
+	return root
+
+def measure(split, message):
+	start = time.perf_counter()
+	pieces = split(message)
+	duration = time.perf_counter() - start
+	return duration, len(pieces)
+
+def main():
+	if len(sys.argv) > 1:
+		things = int(sys.argv[1])
+	else:
+		things = 200000
+	sys.setrecursionlimit(100000)
+	print("Rendering a world of " + str(things) + " things...")
+	message = build_world(things).to_string()
+	megabytes = len(message) / 1024 / 1024
+	print("%.2f MB of output" % megabytes)
+	old_message = message[:old_max_characters]
+	def old(message):
+		pieces = []
+		old_split(message, pieces)
+		return pieces
+	old_time, old_pieces = measure(old, old_message)
+	new_time, new_pieces = measure(lambda message: list(bot.split_message(message)), old_message)
+	print("first %d characters:" % len(old_message))
+	print("before: %.3f seconds, %d messages" % (old_time, old_pieces))
+	print("after:  %.3f seconds, %d messages" % (new_time, new_pieces))
+	new_time, new_pieces = measure(lambda message: list(bot.split_message(message)), message)
+	print("everything:")
+	print("after:  %.3f seconds, %d messages (%.1f MB per second)" % (new_time, new_pieces, megabytes / new_time))
+
+if __name__ == "__main__":
+	main()
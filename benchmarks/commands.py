@@ -0,0 +1,211 @@
+#!/usr/bin/python3.5
+# Command benchmark for Fridge Bot
+# Builds a synthetic Fridgeverse of users, channels, and fridges full of things and bags,
+# drives commands through an in-memory interface the way on_message would,
+# and reports latency percentiles per command, throughput, allocations, and what saving costs
+#
+# Usage: python3 benchmarks/commands.py {--users N} {--channels N} {--items N} {--depth N} {--iterations N} {--concurrency N} {--output results.json}
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bot
+
+all_permissions = frozenset(bot.CommandClass)
+servers_per_channel = 10
+
+class FakeUser():
+	def __init__(self, i):
+		self.id = "u" + str(i)
+		self.name = "user " + str(i)
+
+	def __str__(self):
+		return self.name + "#0000"
+
+class FakeServer():
+	def __init__(self, i):
+		self.id = "s" + str(i)
+		self.name = "server " + str(i)
+
+	def __str__(self):
+		return self.name
+
+class FakeChannel():
+	def __init__(self, i, server):
+		self.id = "c" + str(i)
+		self.name = "channel-" + str(i)
+		self.server = server
+		self.is_private = False
+
+	def __str__(self):
+		return self.name
+
+# an interface that only counts what gets printed
+class BenchmarkInterface(bot.Interface):
+	def __init__(self, channel, user):
+		self.channel = channel
+		self.user = user
+		self.printed = 0
+
+	async def read(self):
+		return None
+
+	async def print(self, message):
+		self.printed += len(message)
+
+	def get_fridge(self):
+		return bot.get_channel_fridge(self.channel)
+
+	def get_fridge_keys(self):
+		return [("channel", self.channel.id), ("user", self.user.id)]
+
+	def get_permissions(self):
+		return all_permissions
+
+def build_world(arguments):
+	bot.logging = False
+	bot.init_world()
+	bot.journaling = False
+	servers = [FakeServer(i) for i in range((arguments.channels + servers_per_channel - 1) // servers_per_channel)]
+	channels = [FakeChannel(i, servers[i // servers_per_channel]) for i in range(arguments.channels)]
+	users = [FakeUser(i) for i in range(arguments.users)]
+	for user in users:
+		bot.get_mini_fridge(user)
+	for channel in channels:
+		fridge = bot.get_channel_fridge(channel)
+		fridge.max_contents = max(fridge.max_contents, arguments.items * 3 + 20)
+		for i in range(arguments.items):
+			thing = bot.Entity("thing " + str(i))
+			thing.set_quantity(random.randint(1, 3))
+			fridge.put_into(thing)
+		container = fridge
+		for depth in range(arguments.depth):
+			bag = bot.EntityBag()
+			container.put_into(bag, False)
+			bag.put_into(bot.Entity("trinket " + str(depth)))
+			container = bag
+	bot.journaling = True
+	bot.snapshot_world()
+	return channels, users
+
+# one user's visit to a channel, touching most of what the fridge commands do
+def get_session(arguments):
+	thing = "thing " + str(random.randrange(arguments.items))
+	return ["look", "take " + thing, "stuff " + thing + ", bag", "unstuff " + thing + ", bag", "store " + thing, "info " + thing, "spawn widget", "despawn widget"]
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[int(round(p / 100 * (len(values) - 1)))]
+
+def summarize(values):
+	return {
+		"count": len(values),
+		"mean_ms": 1000 * sum(values) / len(values),
+		"p50_ms": 1000 * percentile(values, 50),
+		"p90_ms": 1000 * percentile(values, 90),
+		"p99_ms": 1000 * percentile(values, 99),
+		"max_ms": 1000 * max(values),
+	}
+
+async def run_workload(arguments, channels, users, latencies):
+	async def visit():
+		channel = random.choice(channels)
+		user = random.choice(users)
+		for command_string in get_session(arguments):
+			interface = BenchmarkInterface(channel, user)
+			start = time.perf_counter()
+			await bot.parse_command(interface, user, command_string)
+			latencies.setdefault(command_string.split()[0], []).append(time.perf_counter() - start)
+	for i in range(0, arguments.iterations, arguments.concurrency):
+		await asyncio.gather(*[visit() for j in range(min(arguments.concurrency, arguments.iterations - i))])
+
+async def benchmark(arguments):
+	start = time.perf_counter()
+	channels, users = build_world(arguments)
+	build_time = time.perf_counter() - start
+
+	# time every save the commands make
+	save_times = []
+	save_world = bot.save_world
+	async def timed_save_world():
+		start = time.perf_counter()
+		await save_world()
+		save_times.append(time.perf_counter() - start)
+	bot.save_world = timed_save_world
+
+	latencies = {}
+	start = time.perf_counter()
+	await run_workload(arguments, channels, users, latencies)
+	duration = time.perf_counter() - start
+	commands_run = sum(len(values) for values in latencies.values())
+
+	# allocations are measured separately since tracing slows everything down
+	tracemalloc.start()
+	start_memory = tracemalloc.get_traced_memory()[0]
+	await run_workload(arguments, channels, users, {})
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	start = time.perf_counter()
+	await bot.persistence.snapshot()
+	snapshot_time = time.perf_counter() - start
+	bot.save_world = save_world
+
+	return {
+		"revision": get_revision(),
+		"config": vars(arguments),
+		"world": {"entities": len(bot.world_entities), "build_seconds": build_time},
+		"commands": {name: summarize(values) for name, values in sorted(latencies.items())},
+		"throughput": {"commands": commands_run, "seconds": duration, "commands_per_second": commands_run / duration},
+		"allocations": {"retained_bytes": current - start_memory, "peak_bytes": peak - start_memory},
+		"save_world": summarize(save_times) if len(save_times) > 0 else None,
+		"snapshot_seconds": snapshot_time,
+	}
+
+def get_revision():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+	except Exception:
+		return None
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark Fridge Bot commands on a synthetic world.")
+	parser.add_argument("--users", type=int, default=100)
+	parser.add_argument("--channels", type=int, default=20)
+	parser.add_argument("--items", type=int, default=100, help="things in each channel fridge")
+	parser.add_argument("--depth", type=int, default=3, help="bags inside of bags in each channel fridge")
+	parser.add_argument("--iterations", type=int, default=200, help="visits to run, each one a handful of commands")
+	parser.add_argument("--concurrency", type=int, default=1, help="visits running at the same time")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="file to save the results to as json")
+	arguments = parser.parse_args()
+	random.seed(arguments.seed)
+	output = None
+	if arguments.output != None:
+		output = os.path.abspath(arguments.output)
+	# the world and its save files are made in a temporary directory
+	os.chdir(tempfile.mkdtemp(prefix="fridge-benchmark-"))
+	results = asyncio.get_event_loop().run_until_complete(benchmark(arguments))
+	for name, stats in results["commands"].items():
+		print("%-10s %6d runs  p50 %8.3f ms  p90 %8.3f ms  p99 %8.3f ms" % (name, stats["count"], stats["p50_ms"], stats["p90_ms"], stats["p99_ms"]))
+	print("%.1f commands per second" % results["throughput"]["commands_per_second"])
+	if results["save_world"] != None:
+		print("save_world: p50 %.3f ms, p99 %.3f ms" % (results["save_world"]["p50_ms"], results["save_world"]["p99_ms"]))
+	print("snapshot: %.3f seconds of %d entities" % (results["snapshot_seconds"], results["world"]["entities"]))
+	print("allocations: %d bytes retained, %d bytes at peak" % (results["allocations"]["retained_bytes"], results["allocations"]["peak_bytes"]))
+	if output != None:
+		with open(output, "w") as f:
+			json.dump(results, f, indent=2)
+		print("Saved results to " + output)
+
+if __name__ == "__main__":
+	main()
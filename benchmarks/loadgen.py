@@ -0,0 +1,233 @@
+#!/usr/bin/python3.5
+# End to end load generator for Fridge Bot
+# Stands in for discord: fake servers, channels, users, and messages are delivered
+# to the real on_message and on_message_edit handlers at a steady rate,
+# and whatever the bot sends is captured by a fake send_message with discord's rate limits
+# Logging and saving happen like they normally would, in a temporary directory
+#
+# Usage: python3 benchmarks/loadgen.py {--rate N} {--duration N} {--channels N} {--users N} {--commands F} {--edits F} {--output results.json}
+
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bot
+
+# what the users say, weighted by how often they say it
+command_mix = [("look", 5), ("take thing {}", 2), ("store thing {}", 2), ("info thing {}", 1), ("commands", 1)]
+chatter = ["hi", "anyone here?", "lol", "what's in the fridge", "brb"]
+
+class FakeObject():
+	def __init__(self, id, name):
+		self.id = id
+		self.name = name
+
+	def __str__(self):
+		return self.name
+
+class FakeChannel(FakeObject):
+	def __init__(self, id, name, server):
+		super().__init__(id, name)
+		self.server = server
+		self.is_private = False
+
+class FakeMessage():
+	ids = itertools.count(1)
+
+	def __init__(self, author, channel, content):
+		self.id = str(next(self.ids))
+		self.author = author
+		self.channel = channel
+		self.server = channel.server
+		self.content = content
+		self.timestamp = datetime.datetime.utcnow()
+		self.edited_timestamp = None
+
+# takes the place of discord's side of send_message
+# each channel can take rate_limit messages every rate_period seconds, later ones wait like discord.py would
+class FakeDiscord():
+	def __init__(self, arguments):
+		self.latency = arguments.send_latency / 1000
+		self.rate_limit = arguments.rate_limit
+		self.rate_period = arguments.rate_period
+		self.recent = {} # channel id -> times of the latest sends
+		self.sent = collections.Counter() # channel id -> messages sent
+		self.sent_bytes = 0
+		self.rate_limited = 0
+		self.rate_limit_wait = 0.0
+
+	async def send_message(self, channel, content):
+		recent = self.recent.setdefault(channel.id, collections.deque())
+		now = time.perf_counter()
+		while len(recent) > 0 and now - recent[0] > self.rate_period:
+			recent.popleft()
+		if len(recent) >= self.rate_limit:
+			wait = recent[0] + self.rate_period - now
+			self.rate_limited += 1
+			self.rate_limit_wait += wait
+			await asyncio.sleep(wait)
+			recent.popleft()
+		recent.append(time.perf_counter())
+		await asyncio.sleep(self.latency)
+		self.sent[channel.id] += 1
+		self.sent_bytes += len(content)
+
+# follows each command until the last message it queued has been sent
+class LatencyTracker():
+	def __init__(self, discord):
+		self.discord = discord
+		self.queued = collections.Counter() # channel id -> messages queued for it
+		self.waiting = collections.defaultdict(collections.deque) # channel id -> (messages queued by then, start time)
+		self.latencies = []
+		self.handler_times = []
+		send = bot.outbound.send
+		def counting_send(channel, message):
+			self.queued[channel.id] += 1
+			send(channel, message)
+		bot.outbound.send = counting_send
+
+	def command_done(self, channel, start):
+		self.handler_times.append(time.perf_counter() - start)
+		self.waiting[channel.id].append((self.queued[channel.id], start))
+
+	def check(self):
+		now = time.perf_counter()
+		for channel_id, waiting in self.waiting.items():
+			while len(waiting) > 0 and self.discord.sent[channel_id] >= waiting[0][0]:
+				self.latencies.append(now - waiting.popleft()[1])
+
+	def pending(self):
+		return sum(len(waiting) for waiting in self.waiting.values())
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[int(round(p / 100 * (len(values) - 1)))]
+
+def summarize(values):
+	if len(values) == 0:
+		return None
+	return {"count": len(values), "p50_ms": 1000 * percentile(values, 50), "p90_ms": 1000 * percentile(values, 90), "p99_ms": 1000 * percentile(values, 99), "max_ms": 1000 * max(values)}
+
+def pick_message(arguments, users, channels, recent_messages):
+	if len(recent_messages) > 0 and random.random() < arguments.edits:
+		message = random.choice(recent_messages)
+		message.content += " (edited)"
+		message.edited_timestamp = datetime.datetime.utcnow()
+		return message, True
+	author = random.choice(users)
+	channel = random.choice(channels)
+	if random.random() < arguments.commands:
+		command = random.choice([c for c, w in command_mix for i in range(w)])
+		content = bot.bot_trigger + command.format(random.randrange(arguments.items))
+	else:
+		content = random.choice(chatter)
+	return FakeMessage(author, channel, content), False
+
+async def generate_load(arguments):
+	discord = FakeDiscord(arguments)
+	bot.client.send_message = discord.send_message
+	bot.client.user = FakeObject("0", "Fridge Bot")
+	servers = [FakeObject("s" + str(i), "server " + str(i)) for i in range((arguments.channels + 9) // 10)]
+	channels = [FakeChannel("c" + str(i), "channel-" + str(i), servers[i // 10]) for i in range(arguments.channels)]
+	users = [FakeObject("u" + str(i), "user " + str(i) + "#0000") for i in range(arguments.users)]
+	for channel in channels:
+		fridge = bot.get_channel_fridge(channel)
+		for i in range(arguments.items):
+			fridge.put_into(bot.Entity("thing " + str(i)))
+	await bot.save_world()
+	tracker = LatencyTracker(discord)
+	recent_messages = collections.deque(maxlen=100)
+	tasks = set()
+
+	async def deliver(message, edit):
+		start = time.perf_counter()
+		if edit:
+			await bot.on_message_edit(message, message)
+		else:
+			await bot.on_message(message)
+		if message.content.startswith(bot.bot_trigger) and not edit:
+			tracker.command_done(message.channel, start)
+
+	delivered = 0
+	start = time.perf_counter()
+	interval = 1 / arguments.rate
+	while time.perf_counter() - start < arguments.duration:
+		message, edit = pick_message(arguments, users, channels, recent_messages)
+		recent_messages.append(message)
+		task = asyncio.ensure_future(deliver(message, edit))
+		tasks.add(task)
+		task.add_done_callback(tasks.discard)
+		delivered += 1
+		tracker.check()
+		# keep to the schedule, catching up if the bot fell behind
+		wait = start + delivered * interval - time.perf_counter()
+		if wait > 0:
+			await asyncio.sleep(wait)
+	if len(tasks) > 0:
+		await asyncio.wait(tasks)
+	while tracker.pending() > 0 or bot.outbound.queue_depth() > 0:
+		await asyncio.sleep(0.01)
+		tracker.check()
+	duration = time.perf_counter() - start
+	return {
+		"config": vars(arguments),
+		"delivered": delivered,
+		"seconds": duration,
+		"messages_per_second": delivered / duration,
+		"end_to_end": summarize(tracker.latencies),
+		"handler": summarize(tracker.handler_times),
+		"sent": {"messages": sum(discord.sent.values()), "bytes": discord.sent_bytes, "rate_limited": discord.rate_limited, "rate_limit_wait_seconds": discord.rate_limit_wait},
+		"locks": {"acquisitions": bot.fridge_locks.acquisitions, "contended": bot.fridge_locks.contended, "max_wait_ms": 1000 * bot.fridge_locks.max_wait},
+		"persistence": {"journal_writes": bot.persistence.journal_writes, "journal_write_seconds": bot.persistence.journal_write_time},
+		"log": {"written": bot.message_logger.written, "dropped": bot.message_logger.dropped},
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description="Drive Fridge Bot end to end with fake discord traffic.")
+	parser.add_argument("--rate", type=float, default=200, help="messages delivered per second")
+	parser.add_argument("--duration", type=float, default=10, help="seconds to deliver messages for")
+	parser.add_argument("--channels", type=int, default=50)
+	parser.add_argument("--users", type=int, default=500)
+	parser.add_argument("--items", type=int, default=50, help="things in each channel fridge")
+	parser.add_argument("--commands", type=float, default=0.3, help="fraction of messages that are commands")
+	parser.add_argument("--edits", type=float, default=0.05, help="fraction of messages that are edits of earlier ones")
+	parser.add_argument("--send-latency", type=float, default=50, help="milliseconds discord takes to accept a message")
+	parser.add_argument("--rate-limit", type=int, default=5, help="messages discord accepts per channel...")
+	parser.add_argument("--rate-period", type=float, default=5, help="...every this many seconds")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="file to save the results to as json")
+	arguments = parser.parse_args()
+	random.seed(arguments.seed)
+	output = None
+	if arguments.output != None:
+		output = os.path.abspath(arguments.output)
+	os.chdir(tempfile.mkdtemp(prefix="fridge-loadgen-"))
+	bot.init_world()
+	bot.init_permissions()
+	try:
+		results = asyncio.get_event_loop().run_until_complete(generate_load(arguments))
+	finally:
+		bot.persistence.flush()
+		bot.message_logger.stop()
+	print("%d messages in %.1f seconds, %.1f messages per second" % (results["delivered"], results["seconds"], results["messages_per_second"]))
+	for name in ["end_to_end", "handler"]:
+		if results[name] != None:
+			print("%-10s p50 %8.2f ms  p90 %8.2f ms  p99 %8.2f ms  max %8.2f ms" % (name, results[name]["p50_ms"], results[name]["p90_ms"], results[name]["p99_ms"], results[name]["max_ms"]))
+	print("sent %d messages, %d of them held back by rate limits" % (results["sent"]["messages"], results["sent"]["rate_limited"]))
+	print("logged %d messages, dropped %d" % (results["log"]["written"], results["log"]["dropped"]))
+	if output != None:
+		with open(output, "w") as f:
+			json.dump(results, f, indent=2)
+		print("Saved results to " + output)
+
+if __name__ == "__main__":
+	main()
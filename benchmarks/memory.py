@@ -0,0 +1,85 @@
+#!/usr/bin/python3.5
+# Memory benchmark for Fridgeverse entities
+# Builds a synthetic world of things spread across channel fridges
+# and reports how many bytes each entity takes up,
+# first with entities laid out the way they used to be and then with the real Entity class
+#
+# Usage: python3 benchmarks/memory.py {number of things}
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bot
+
+things_per_fridge = 200
+
+# the old layout: a __dict__ per entity, a contents list each, and the description on every instance
+class OldEntity():
+	def __init__(self, entity_name, description="A very average thing."):
+		self.entity_name = entity_name
+		self.contents = []
+		self.fridge = False
+		self.private = False
+		self.parent = None
+		self.creator = None
+		self.created_time = time.time()
+		self.last_user = None
+		self.last_used = None
+		self.description = description
+		self.max_contents = 3
+		self.movable = True
+
+def build_old_world(things):
+	root = OldEntity("Fridgeverse")
+	fridge = None
+	for i in range(things):
+		if i % things_per_fridge == 0:
+			fridge = OldEntity("fridge " + str(i))
+			fridge.max_contents = things_per_fridge
+			fridge.parent = root
+			root.contents.append(fridge)
+		thing = OldEntity("thing " + str(i % 1000))
+		thing.parent = fridge
+		fridge.contents.append(thing)
+	return root
+
+# every thing is made separately so nothing gets stacked
+def build_new_world(things):
+	root = bot.Entity("Fridgeverse")
+	fridge = None
+	for i in range(things):
+		if i % things_per_fridge == 0:
+			fridge = bot.Entity("fridge " + str(i))
+			fridge.max_contents = things_per_fridge
+			root.add_content(fridge)
+		fridge.add_content(bot.Entity("thing " + str(i % 1000)))
+	return root
+
+def measure(build, things):
+	tracemalloc.start()
+	start_memory = tracemalloc.get_traced_memory()[0]
+	start = time.perf_counter()
+	world = build(things)
+	duration = time.perf_counter() - start
+	memory = tracemalloc.get_traced_memory()[0] - start_memory
+	tracemalloc.stop()
+	entities = things + (things + things_per_fridge - 1) // things_per_fridge + 1
+	return memory / entities, duration
+
+def main():
+	if len(sys.argv) > 1:
+		things = int(sys.argv[1])
+	else:
+		things = 1000000
+	print("Building a world of " + str(things) + " things...")
+	old_bytes, old_time = measure(build_old_world, things)
+	print("before: %.1f bytes per entity (built in %.2f seconds)" % (old_bytes, old_time))
+	new_bytes, new_time = measure(build_new_world, things)
+	print("after:  %.1f bytes per entity (built in %.2f seconds)" % (new_bytes, new_time))
+	print("%.1f%% of the memory used before" % (100 * new_bytes / old_bytes))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3.5
+# Tick scheduler benchmark
+# Schedules a lot of timers on a TickScheduler, cancels half of them, and pops everything as it comes due,
+# then does the same with a plain list that gets scanned for due timers on every tick,
+# which is what polling every entity in the world would cost
+#
+# Usage: python3 benchmarks/scheduler.py {--timers N} {--ticks N} {--output results.json}
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bot
+
+class FakeEntity():
+	def __init__(self, entity_id):
+		self.entity_id = entity_id
+
+def measure_heap(arguments, times, entities):
+	bot.journaling = False
+	# memory is measured separately since tracing slows everything down
+	scheduler = bot.TickScheduler()
+	tracemalloc.start()
+	start_memory = tracemalloc.get_traced_memory()[0]
+	for entity, at in zip(entities, times):
+		scheduler.schedule(entity, at, "tick")
+	memory = tracemalloc.get_traced_memory()[0] - start_memory
+	tracemalloc.stop()
+	scheduler = bot.TickScheduler()
+	start = time.perf_counter()
+	timer_ids = [scheduler.schedule(entity, at, "tick") for entity, at in zip(entities, times)]
+	schedule_time = time.perf_counter() - start
+	cancelled = timer_ids[::2]
+	start = time.perf_counter()
+	for timer_id in cancelled:
+		scheduler.cancel(timer_id)
+	cancel_time = time.perf_counter() - start
+	popped = 0
+	start = time.perf_counter()
+	for tick in range(1, arguments.ticks + 1):
+		popped += len(scheduler.pop_due(tick / arguments.ticks, len(times)))
+	pop_time = time.perf_counter() - start
+	return {
+		"schedule_per_second": len(times) / schedule_time,
+		"cancel_per_second": len(cancelled) / cancel_time,
+		"pop_seconds": pop_time,
+		"popped": popped,
+		"bytes_per_timer": memory / len(times),
+	}
+
+# the naive way: every tick looks at every timer that's still waiting
+def measure_polling(arguments, times, entities):
+	timers = {}
+	start = time.perf_counter()
+	for timer_id, (entity, at) in enumerate(zip(entities, times)):
+		timers[timer_id] = (at, entity.entity_id, "tick")
+	schedule_time = time.perf_counter() - start
+	cancelled = range(0, len(times), 2)
+	start = time.perf_counter()
+	for timer_id in cancelled:
+		del timers[timer_id]
+	cancel_time = time.perf_counter() - start
+	popped = 0
+	start = time.perf_counter()
+	for tick in range(1, arguments.ticks + 1):
+		now = tick / arguments.ticks
+		due = [timer_id for timer_id, timer in timers.items() if timer[0] <= now]
+		for timer_id in due:
+			del timers[timer_id]
+		popped += len(due)
+	pop_time = time.perf_counter() - start
+	return {
+		"schedule_per_second": len(times) / schedule_time,
+		"cancel_per_second": len(cancelled) / cancel_time,
+		"pop_seconds": pop_time,
+		"popped": popped,
+	}
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the tick scheduler against polling.")
+	parser.add_argument("--timers", type=int, default=1000000)
+	parser.add_argument("--ticks", type=int, default=1000, help="times the due timers are collected, spread evenly over when they're due")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="file to save the results to as json")
+	arguments = parser.parse_args()
+	random.seed(arguments.seed)
+	times = [random.random() for i in range(arguments.timers)]
+	entities = [FakeEntity(i) for i in range(arguments.timers)]
+	print("%d timers, half of them cancelled, popped over %d ticks" % (arguments.timers, arguments.ticks))
+	results = {"config": vars(arguments), "heap": measure_heap(arguments, times, entities), "polling": measure_polling(arguments, times, entities)}
+	for name in ["polling", "heap"]:
+		stats = results[name]
+		print("%-8s schedule %10.0f/s  cancel %10.0f/s  pop everything %7.3f seconds (%d timers)" % (name, stats["schedule_per_second"], stats["cancel_per_second"], stats["pop_seconds"], stats["popped"]))
+	print("heap: %.1f bytes per pending timer" % results["heap"]["bytes_per_timer"])
+	if arguments.output != None:
+		with open(arguments.output, "w") as f:
+			json.dump(results, f, indent=2)
+		print("Saved results to " + arguments.output)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,83 @@
+#!/usr/bin/python3.5
+# Snapshot benchmark
+# Builds a synthetic world of things, bags, and notes spread across channel fridges,
+# saves it as a pickle the way the save file used to be and as a snapshot,
+# and compares how long each takes to write and load and how big the files are
+#
+# Usage: python3 benchmarks/snapshot.py {number of things}
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import bot
+
+things_per_fridge = 200
+bag_every = 50 # every so often a thing is a bag with a note in it instead
+
+def build_world(things):
+	root = bot.Entity("Fridgeverse")
+	fridge = None
+	for i in range(things):
+		if i % things_per_fridge == 0:
+			fridge = bot.Entity("fridge " + str(i), fridge=True)
+			fridge.max_contents = things_per_fridge
+			fridge.fridge_key = ("channel", str(i))
+			root.add_content(fridge)
+		if i % bag_every == 0:
+			bag = bot.EntityBag()
+			note = bot.EntityNote()
+			note.message = "note " + str(i)
+			bag.add_content(note)
+			fridge.add_content(bag)
+		else:
+			thing = bot.Entity("thing " + str(i % 1000), creator="user " + str(i % 100) + "#0000")
+			thing.quantity = i % 3 + 1
+			fridge.add_content(thing)
+	bot.register_entity(root)
+	return root
+
+def write_pickle(root, save_file):
+	with open(save_file, "wb") as f:
+		pickle.dump({"root": root, "sequence": 0, "timers": []}, f, pickle.HIGHEST_PROTOCOL)
+
+def write_snapshot(root, save_file):
+	with open(save_file, "wb") as f:
+		bot.encode_snapshot(f, root, 0, [])
+
+def measure(function, *args):
+	start = time.perf_counter()
+	result = function(*args)
+	return time.perf_counter() - start, result
+
+def main():
+	if len(sys.argv) > 1:
+		things = int(sys.argv[1])
+	else:
+		things = 1000000
+	sys.setrecursionlimit(100000)
+	print("Building a world of " + str(things) + " things...")
+	root = build_world(things)
+	entities = len(bot.world_entities)
+	directory = tempfile.mkdtemp(prefix="fridge-snapshot-")
+	pickle_file = os.path.join(directory, "pickle.sav")
+	snapshot_file = os.path.join(directory, "snapshot.sav")
+	results = []
+	for name, write, save_file in [("pickle", write_pickle, pickle_file), ("snapshot", write_snapshot, snapshot_file)]:
+		write_time, result = measure(write, root, save_file)
+		load_time, world = measure(bot.load_world, save_file, True)
+		loaded = sum(1 for depth, entity in world[0].walk())
+		if loaded != entities:
+			print(name + " loaded " + str(loaded) + " of " + str(entities) + " entities!")
+		results.append((name, write_time, load_time, os.path.getsize(save_file)))
+		os.remove(save_file)
+	os.rmdir(directory)
+	for name, write_time, load_time, size in results:
+		print("%-8s write %6.2f seconds  load %6.2f seconds  %7.1f MB  %5.1f bytes per entity" % (name, write_time, load_time, size / 1024 / 1024, size / entities))
+	print("the snapshot loads in %.1f%% of the time and takes %.1f%% of the space" % (100 * results[1][2] / results[0][2], 100 * results[1][3] / results[0][3]))
+
+if __name__ == "__main__":
+	main()
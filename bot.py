@@ -1,18 +1,37 @@
 #!/usr/bin/python3.5
 import discord
 import asyncio
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import contextlib
 import json
+import os
 import pickle
+import queue
 import time
 import datetime
 import dateutil.relativedelta
 import enum
+import gc
+import gzip
+import heapq
+import io
+import itertools
 import random
+import re
+import shutil
+import sys
+import sqlite3
+import struct
+import threading
+import types
+import zlib
 
 # Hi fellow source code readers!
 
 ### Major Todo Stuff ###
-# figure out how coroutines actually work and make a properly working ConsoleInterface
 # ...as well as potentially adding interfaces to other chat services (chatango, skype, tinychat... irc... minecraft!)
 # add a locale / language system, and cleanup all the _super messy_ language manipulation code
 
@@ -41,9 +60,38 @@ bot_trigger = "!"
 token_file = "token"
 permissions_file = "permissions.cfg"
 save_file = "fridgeverse.sav"
+journal_file = "fridgeverse.journal"
+journal_compact_threshold = 1000 # journal entries before they are compacted into the save file
+journal_fsync = True
+journal_retry_delay = 1 # seconds to wait before writing journal entries again after a write fails
+max_save_staleness = 60 # seconds the save file can fall behind the journal
+snapshot_retry_delay = 10 # seconds to wait before trying again after a snapshot fails
+snapshot_fork = True # take snapshots in a forked process where possible
+storage_backend = "journal" # or "sqlite" to keep Fridgeverse in the database and only load the fridges being used
+database_file = "fridgeverse.db"
+max_loaded_fridges = 1000 # fridges the sqlite backend keeps in memory
+fridge_idle_time = 300 # seconds a fridge has to go unused before it can be unloaded
 log_file = "fridge.log"
 logging = True
+log_queue_size = 10000 # log entries waiting to be written before some are dropped
+log_overflow = "drop_newest" # or "drop_oldest", which entries to drop when the queue is full
+log_flush_entries = 500 # write once this many entries are waiting
+log_flush_interval = 1 # or once the oldest waiting entry is this many seconds old
+log_max_bytes = 50 * 1024 * 1024 # rotate the log once it gets this big, and every day
 max_message_length = 2000
+channel_rate_limit = 5 # messages a channel can be sent...
+channel_rate_period = 5 # ...every this many seconds
+reply_timeout = 300 # seconds a command waits for a reply before giving up
+look_cache_size = 10000 # fridge listings to keep around
+world_page_lines = 50 # lines of the world outline printed at a time
+world_cursors_kept = 100 # world outlines that can be paged through at once
+world_dump_file = "fridgeverse-world.txt"
+find_results_shown = 10 # things listed by the find command
+find_similarity = 0.5 # how close a name has to be to what's being found, from 0 to 1
+timer_batch_size = 1000 # timers run before the world is saved and other things get a turn
+metrics_file = None # such as "fridge.prom", to write command metrics there every metrics_interval seconds
+metrics_interval = 60
+command_prefixes = False # let commands be invoked by any prefix of an alias that only one command has
 
 ### Utility Stuff ###
 
@@ -53,6 +101,38 @@ def to_int(string):
 	except:
 		return None
 
+# the value that a fraction of the values are at or below
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[int(round(fraction * (len(values) - 1)))]
+
+# the task running right now, which is a different function depending on the version of python
+def current_task():
+	if hasattr(asyncio, "current_task"):
+		return asyncio.current_task()
+	return asyncio.Task.current_task()
+
+# the plural form of the name of a thing
+def pluralize(name):
+	if name[-1] in ["s", "x"]:
+		return name + "es"
+	elif name[-1] == "y":
+		return name[:-1] + "ies"
+	else:
+		return name + "s"
+
+# the singular form of the plural name of a thing
+def singularize(name):
+	if name.endswith("ies"):
+		return name[:-3] + "y"
+	elif name.endswith("les"):
+		return name[:-1]
+	elif name.endswith("es"):
+		return name[:-2]
+	elif name.endswith("s"):
+		return name[:-1]
+	return name
+
 ### Permissions Stuff
 
 class CommandClass(enum.Enum):
@@ -75,18 +155,31 @@ def command_class_from_string(string):
 # and where the second item is lost permissions
 permissions = {"Aardbei#8517": ([CommandClass.admin], [])} # default
 # permissions that users have by defailt
-standard_permissions = [CommandClass.fridge, CommandClass.common]
+standard_permissions = frozenset([CommandClass.fridge, CommandClass.common])
+console_permissions = frozenset(CommandClass) # the console can do anything
+# final effective permissions by user tag, worked out when they're first needed
+effective_permissions = {}
 
 # get the final effective permissions for a user
 def get_permissions(user):
-	final = list(standard_permissions)
-	if str(user) in permissions.keys():
-		for gained in permissions[str(user)][0]:
-			final.append(gained)
-		for lost in permissions[str(user)][1]:
-			final.remove(lost)
+	user_tag = str(user)
+	final = effective_permissions.get(user_tag)
+	if final == None:
+		if user_tag in permissions.keys():
+			gained, lost = permissions[user_tag]
+			final = (standard_permissions | frozenset(gained)) - frozenset(lost)
+		else:
+			final = standard_permissions
+		effective_permissions[user_tag] = final
 	return final
 
+# forget the effective permissions of a user, or of everyone, after they've changed
+def invalidate_permissions(user_tag=None):
+	if user_tag == None:
+		effective_permissions.clear()
+	else:
+		effective_permissions.pop(user_tag, None)
+
 class EnumEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, enum.Enum):
@@ -104,52 +197,283 @@ def save_permissions(save_file=permissions_file):
 	with open(save_file, "w", encoding='UTF-8') as f:
 		json.dump(permissions, f, cls=EnumEncoder)
 
+def write_permissions(data, save_file=permissions_file):
+	temp_file = save_file + ".tmp"
+	with open(temp_file, "w", encoding='UTF-8') as f:
+		f.write(data)
+	os.replace(temp_file, save_file)
+
+permissions_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) # keeps permission saves in order
+
+# save the permissions without blocking the event loop
+# they're encoded right away so later changes can't end up half written
+async def save_permissions_later():
+	data = json.dumps(permissions, cls=EnumEncoder)
+	await asyncio.get_event_loop().run_in_executor(permissions_executor, write_permissions, data)
+
 def load_permissions(save_file=permissions_file):
 	with open(save_file, "r", encoding='UTF-8') as f:
 		return json.load(f, object_hook=as_enum)
 
 def init_permissions():
 	global permissions
-	import os.path
 	if os.path.exists(permissions_file):
 		permissions = load_permissions()
 	else:
 		save_permissions()
-
-### Global Variables and Stuff ###
-
-ignore_messages = []
+	invalidate_permissions()
 
 ### Logging Stuff ###
 
+# writes log entries from a background thread so the event loop never waits on the disk
+# entries are written in batches, and the log file is rotated and compressed
+# when it gets too big or when the day changes
+class MessageLogger():
+	def __init__(self, log_file):
+		self.log_file = log_file
+		self.queue = queue.Queue(log_queue_size)
+		self.thread = None
+		self.file = None
+		self.file_date = None
+		self.written = 0
+		self.dropped = 0
+		self.rotations = 0
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name="logger", daemon=True)
+		self.thread.start()
+
+	# never blocks, what happens when the queue is full is up to log_overflow
+	def log(self, entry):
+		if self.thread == None:
+			self.start()
+		try:
+			self.queue.put_nowait(entry)
+		except queue.Full:
+			self.dropped += 1
+			if log_overflow == "drop_oldest":
+				try:
+					self.queue.get_nowait()
+					self.queue.put_nowait(entry)
+				except (queue.Empty, queue.Full):
+					pass
+
+	def queue_depth(self):
+		return self.queue.qsize()
+
+	# write everything that is left and stop the background thread
+	def stop(self):
+		if self.thread != None:
+			self.queue.put(None)
+			self.thread.join()
+			self.thread = None
+
+	def run(self):
+		batch = []
+		last_flush = time.time()
+		while True:
+			try:
+				entry = self.queue.get(timeout=log_flush_interval)
+			except queue.Empty:
+				entry = ""
+			if entry == None:
+				self.write(batch)
+				break
+			if entry != "":
+				batch.append(entry)
+			if len(batch) >= log_flush_entries or (len(batch) > 0 and time.time() - last_flush >= log_flush_interval):
+				self.write(batch)
+				batch = []
+				last_flush = time.time()
+		if self.file != None:
+			self.file.close()
+			self.file = None
+
+	def write(self, batch):
+		if len(batch) == 0:
+			return
+		data = "\n".join(batch) + "\n"
+		if self.file == None:
+			self.open()
+		elif self.file_date != datetime.date.today() or self.file.tell() + len(data) > log_max_bytes:
+			self.rotate()
+		self.file.write(data)
+		self.file.flush()
+		self.written += len(batch)
+
+	def open(self):
+		self.file = open(self.log_file, "a", encoding='UTF-8')
+		if self.file.tell() > 0:
+			self.file_date = datetime.date.fromtimestamp(os.path.getmtime(self.log_file))
+		else:
+			self.file_date = datetime.date.today()
+
+	# move the current log aside as a compressed file and start a new one
+	def rotate(self):
+		self.file.close()
+		rotated_file = self.log_file + "." + datetime.datetime.now().strftime("%Y-%m-%d-%H%M%S")
+		number = 1
+		while os.path.exists(rotated_file + ".gz"):
+			number += 1
+			rotated_file = self.log_file + "." + datetime.datetime.now().strftime("%Y-%m-%d-%H%M%S") + "-" + str(number)
+		os.replace(self.log_file, rotated_file)
+		try:
+			with open(rotated_file, "rb") as f_in, gzip.open(rotated_file + ".gz", "wb") as f_out:
+				shutil.copyfileobj(f_in, f_out)
+			os.remove(rotated_file)
+		except OSError as e:
+			print("Failed to compress " + rotated_file + ": " + str(e))
+		self.rotations += 1
+		self.open()
+
+message_logger = MessageLogger(log_file)
+
 def log(message):
-	with open(log_file, "a", encoding='UTF-8') as f:
-		entry = "\t".join([str(message.id), str(message.timestamp), str(message.edited_timestamp), str(message.server), str(message.author), message.content])
-		f.write(entry + "\n")
+	entry = "\t".join([str(message.id), str(message.timestamp), str(message.edited_timestamp), str(message.server), str(message.author), message.content])
+	message_logger.log(entry)
 
 ### World Stuff ###
 
+# what happened when trying to move things with move_many
+class MoveResult(enum.Enum):
+	moved = 1
+	missing = 2
+	too_few = 3
+	full = 4
+	too_full = 5
+	glued = 6
+	into_itself = 7
+
+# the key that entities are looked up by name with
+def name_key(entity_name):
+	key = entity_name.casefold()
+	if key == entity_name:
+		return entity_name # share the string instead of keeping a copy
+	return key
+
+# a name of things along with the forms it's printed in
+class NameEntry():
+	__slots__ = ("key", "display", "plural", "article")
+
+	def __init__(self, display):
+		self.display = display
+		self.key = name_key(display)
+		self.plural = pluralize(display)
+		if display[:1] in ["a", "e", "i", "o", "u"]:
+			self.article = "an"
+		else:
+			self.article = "a"
+
+# every distinct name of things, kept once no matter how many things have it
+class NameTable():
+	def __init__(self):
+		self.entries = {} # name -> its entry
+		self.forms = {} # casefolded name or plural -> entry, with names winning over plurals
+
+	def get(self, name):
+		entry = self.entries.get(name)
+		if entry == None:
+			entry = NameEntry(name)
+			self.entries[name] = entry
+			self.forms[entry.key] = entry
+			self.forms.setdefault(name_key(entry.plural), entry)
+		return entry
+
+	# the copy of a name that every thing with that name shares
+	def intern(self, name):
+		return self.get(name).display
+
+	# the name someone meant when they asked for amount of something
+	# if there's more than one they probably said it in plural, which is looked up, or else worked out for names that aren't known
+	def resolve(self, text, amount=1):
+		key = name_key(text)
+		entry = self.forms.get(key)
+		if entry != None and (amount != 1 or entry.key == key):
+			return entry.display
+		if amount != 1:
+			return singularize(text)
+		return text
+
+name_table = NameTable()
+
+# an entity attribute that is only stored when it isn't the default for the type of thing
+# most entities never need any of these, so they don't get a dictionary to keep them in at all
+def extra_attribute(name):
+	default_name = "default_" + name
+	def get(self):
+		if self._extra == None or name not in self._extra:
+			return getattr(self, default_name)
+		return self._extra[name]
+	def set(self, value):
+		if value == getattr(self, default_name):
+			if self._extra != None and name in self._extra:
+				del self._extra[name]
+				if len(self._extra) == 0:
+					self._extra = None
+		else:
+			if self._extra == None:
+				self._extra = {}
+			self._extra[name] = value
+	return property(get, set)
+
+# there can be a whole lot of entities, so they are kept small
+# nothing inside is allocated until something is put inside
 class Entity():
-	def __init__(self, entity_name, fridge=False, private=False, parent=None, creator=None, description="A very average thing."):
-		self.entity_name = entity_name
-		self.contents = []
-		self.fridge = fridge
-		self.private = private
+	__slots__ = ("entity_name", "parent", "entity_id", "quantity", "item_count", "version", "creator", "created_time", "last_user", "last_used", "_name_index", "_extra")
+
+	default_fridge = False
+	default_private = False
+	default_movable = True
+	default_fridge_key = None
+	default_description = "A very average thing."
+	default_max_contents = 3
+
+	fridge = extra_attribute("fridge")
+	private = extra_attribute("private")
+	movable = extra_attribute("movable")
+	fridge_key = extra_attribute("fridge_key") # set on fridges that belong to a user, server, or channel
+	description = extra_attribute("description")
+	max_contents = extra_attribute("max_contents")
+	extra_attributes = ["fridge", "private", "movable", "fridge_key", "description", "max_contents"]
+
+	def __init__(self, entity_name, fridge=False, private=False, parent=None, creator=None, description=None):
+		self.entity_name = name_table.intern(entity_name)
 		self.parent = parent
+		self.entity_id = None
 		self.creator = creator
 		self.created_time = time.time()
 		self.last_user = None
 		self.last_used = None
-		self.description = description
-
-		self.max_contents = 3
-		self.movable = True
+		self.quantity = 1 # how many identical things this entity stands for
+		self.item_count = 0 # total quantity of everything in contents
+		self.version = 0 # goes up every time the contents change
+		self._name_index = None # casefolded name -> the entity with that name, or a dict of them if there are more
+		self._extra = None
+		if fridge:
+			self.fridge = fridge
+		if private:
+			self.private = private
+		if description != None:
+			self.description = description
+
+	# a list of everything inside of this entity
+	# the name index is the only place contents are kept, grouped by name
+	@property
+	def contents(self):
+		contents = []
+		if self._name_index != None:
+			for bucket in self._name_index.values():
+				if isinstance(bucket, dict):
+					contents.extend(bucket)
+				else:
+					contents.append(bucket)
+		return contents
 
 	def is_full(self):
-		return len(self.contents) >= self.max_contents
+		return self.item_count >= self.max_contents
 
 	def remaining_space(self):
-		return self.max_contents - len(self.contents)
+		return self.max_contents - self.item_count
 
 	def can_hold_things(self):
 		return self.max_contents > 0
@@ -163,11 +487,48 @@ class Entity():
 		else:
 			return self.entity_name
 
+	# add an entity to this entity's contents without any record of it
+	def add_content(self, entity):
+		if self._name_index == None:
+			self._name_index = {}
+		key = name_key(entity.entity_name)
+		bucket = self._name_index.get(key)
+		if bucket == None:
+			self._name_index[key] = entity
+		elif isinstance(bucket, dict):
+			bucket[entity] = None
+		else:
+			self._name_index[key] = {bucket: None, entity: None}
+		self.change_count(entity.quantity)
+		entity.parent = self
+		if entity.entity_id != None and world_entities.get(entity.entity_id) is entity:
+			name_index.add_tree(entity) # it might be in a different fridge now
+
+	# the total quantity of things inside changed by amount
+	def change_count(self, amount):
+		self.item_count += amount
+		self.version += 1
+
+	# remove an entity from this entity's contents without any record of it
+	def remove_content(self, entity):
+		key = name_key(entity.entity_name)
+		bucket = self._name_index[key]
+		if isinstance(bucket, dict):
+			del bucket[entity]
+			if len(bucket) == 1:
+				self._name_index[key] = next(iter(bucket))
+		else:
+			del self._name_index[key]
+		if len(self._name_index) == 0:
+			self._name_index = None
+		self.change_count(-entity.quantity)
+		entity.parent = None
+
 	# take an entity from this entity's contents
 	def take_from(self, entity):
-		if entity in self.contents:
-			self.contents.remove(entity)
-			entity.parent = None
+		if entity.parent is self:
+			self.remove_content(entity)
+			record_destroy(entity)
 			return entity
 		else:
 			return None
@@ -178,37 +539,170 @@ class Entity():
 		if entity == None:
 			return None
 		else:
-			self.contents.remove(entity)
-			entity.parent = None
+			self.remove_content(entity)
+			record_destroy(entity)
 			return entity
 
 	# take this entity out of its parent entity
 	def take(self):
 		if self.parent != None:
-			self.parent.contents.remove(self)
-			self.parent = None
+			self.parent.remove_content(self)
+			record_destroy(self)
 			return self
 		else:
 			return None
 
 	# put this entity into another entity
 	def put(self, parent):
-		self.take()
-		parent.contents.append(self)
-		self.parent = parent
+		parent.put_into(self)
 
 	# put another entity into this entity
-	def put_into(self, entity):
-		entity.take()
-		self.contents.append(entity)
-		entity.parent = self
+	# identical generic things are stacked together unless stack is False
+	# returns the entity that ended up inside
+	def put_into(self, entity, stack=True):
+		if entity.parent != None:
+			entity.parent.remove_content(entity)
+		if stack:
+			other = self.get_stack_for(entity)
+			if other != None:
+				record_destroy(entity)
+				other.set_quantity(other.quantity + entity.quantity)
+				return other
+		record_move(entity, self)
+		self.add_content(entity)
+		return entity
+
+	### Stacking ###
+
+	# only generic things with nothing inside of them are stacked
+	def is_stackable(self):
+		return type(self) is Entity and not self.fridge and self.fridge_key == None and self._name_index == None
+
+	# things stack if they are the same in every way
+	def get_stack_key(self):
+		return (self.entity_name, self.creator, self.created_time, self.last_user, self.last_used, self.description, self.max_contents, self.movable)
+
+	# find a stack inside of this entity that entity can join
+	def get_stack_for(self, entity):
+		if not entity.is_stackable():
+			return None
+		stack_key = entity.get_stack_key()
+		for other in self.get_entities(entity.entity_name):
+			if other is not entity and other.is_stackable() and other.get_stack_key() == stack_key:
+				return other
+		return None
+
+	def set_quantity(self, quantity):
+		if self.parent != None:
+			self.parent.change_count(quantity - self.quantity)
+		self.quantity = quantity
+		record_mutation(self)
+
+	# a new identical stack of things outside of everything
+	def copy(self, quantity):
+		entity = Entity(self.entity_name)
+		entity.update_state(get_entity_state(self))
+		entity.entity_id = None
+		entity.quantity = quantity
+		return entity
+
+	# split up to amount things off of this stack
+	# returns this entity if that's all of it, otherwise a new stack outside of everything
+	def split(self, amount):
+		if amount >= self.quantity:
+			return self
+		entity = self.copy(amount)
+		self.set_quantity(self.quantity - amount)
+		return entity
+
+	# check whether amount things called entity_name could move from this entity into dest
+	# returns the result and the (entity, amount) pieces that would move
+	def plan_move(self, entity_name, amount, dest):
+		entities = self.get_entities(entity_name)
+		count = sum(entity.quantity for entity in entities)
+		if count == 0:
+			return MoveResult.missing, []
+		elif amount > count:
+			return MoveResult.too_few, []
+		elif dest != None and dest.is_full():
+			return MoveResult.full, []
+		elif dest != None and dest.remaining_space() < amount:
+			return MoveResult.too_full, []
+		plan = []
+		left = amount
+		for entity in entities:
+			if left == 0:
+				break
+			if not entity.movable:
+				return MoveResult.glued, []
+			amount_moved = min(left, entity.quantity)
+			plan.append((entity, amount_moved))
+			left -= amount_moved
+		if dest is self:
+			return MoveResult.moved, []
+		container = dest
+		while container != None:
+			for entity, amount_moved in plan:
+				if entity is container:
+					return MoveResult.into_itself, []
+			container = container.parent
+		return MoveResult.moved, plan
+
+	# move amount things called entity_name from this entity into dest all at once
+	# or out of the world entirely if dest is None
+	# everything is checked first, so either all of it moves or none of it does
+	def move_many(self, entity_name, amount, dest):
+		result, plan = self.plan_move(entity_name, amount, dest)
+		if len(plan) == 0:
+			return result
+		parts = []
+		for entity, amount_moved in plan:
+			if dest == None:
+				stack = None
+			else:
+				stack = dest.get_stack_for(entity)
+			piece = move_part(entity, amount_moved, dest, stack)
+			if stack != None:
+				parts.append((entity.entity_id, amount_moved, None, stack.entity_id))
+			elif piece is entity:
+				parts.append((entity.entity_id, amount_moved, None, None))
+			else:
+				parts.append((entity.entity_id, amount_moved, piece.entity_id, None))
+		if journaling and in_world(self):
+			if dest == None:
+				journal_records.append(("move_many", None, parts))
+			else:
+				journal_records.append(("move_many", dest.entity_id, parts))
+		return MoveResult.moved
+
+	def rename(self, entity_name):
+		parent = self.parent
+		if parent != None:
+			parent.remove_content(self)
+		self.entity_name = name_table.intern(entity_name)
+		if parent != None:
+			parent.add_content(self)
+		record_mutation(self)
+
+	# get all of the entities in contents with a name
+	def get_entities(self, entity_name):
+		if self._name_index == None:
+			return ()
+		bucket = self._name_index.get(name_key(entity_name))
+		if bucket == None:
+			return ()
+		elif isinstance(bucket, dict):
+			return bucket
+		return (bucket,)
 
 	# get an entity from contents by name
 	def get_entity(self, entity_name):
-		for entity in self.contents:
-			if entity_name.lower() == entity.entity_name.lower():
-				return entity
-		return None
+		if self._name_index == None:
+			return None
+		bucket = self._name_index.get(name_key(entity_name))
+		if isinstance(bucket, dict):
+			return next(iter(bucket))
+		return bucket
 
 	# get an entity and create it if it doesn't exist
 	def get_entity_implicit(self, entity_name):
@@ -220,11 +714,36 @@ class Entity():
 
 	# find out how many entities of a given name are contained in this entity
 	def count_entity(self, entity_name):
-		count = 0
-		for entity in self.contents:
-			if entity_name.lower() == entity.entity_name.lower():
-				count += 1
-		return count
+		return sum(entity.quantity for entity in self.get_entities(entity_name))
+
+	# everything about this entity except where it is and what is inside of it
+	def get_state(self):
+		return {"entity_name": self.entity_name, "entity_id": self.entity_id, "fridge_key": self.fridge_key, "fridge": self.fridge, "private": self.private, "movable": self.movable, "quantity": self.quantity, "creator": self.creator, "created_time": self.created_time, "last_user": self.last_user, "last_used": self.last_used, "description": self.description, "max_contents": self.max_contents}
+
+	def update_state(self, state):
+		for key, value in state.items():
+			if key == "entity_name":
+				self.entity_name = name_table.intern(value)
+			elif key not in ["contents", "parent"] and hasattr(type(self), key):
+				setattr(self, key, value)
+
+	# saved the same way as before entities had slots, leaving out defaults
+	# the name index and item count aren't saved, they're rebuilt when loading
+	def __getstate__(self):
+		state = self.get_state()
+		for name in self.extra_attributes:
+			if self._extra == None or name not in self._extra:
+				del state[name]
+		if self.quantity == 1:
+			del state["quantity"]
+		state["contents"] = list(self.contents)
+		return state
+
+	def __setstate__(self, state):
+		Entity.__init__(self, state["entity_name"])
+		self.update_state(state)
+		for entity in state.get("contents", []): # older save files kept the parent too, which isn't needed
+			self.add_content(entity)
 
 	async def interact(self, interface, user, args):
 		self.last_user = str(user)
@@ -275,17 +794,35 @@ class Entity():
 			about_string += "And that was **" + used_age + "** ago."
 		await interface.print(about_string)
 	
-	# text heiarchy
-	def to_string(self, pre=""):
-		s = pre + self.entity_name + "\n"
-		for e in self.contents:
-			s += e.to_string(pre + "> ")
-		return s
+	# this entity and everything inside of it as (depth, entity), outermost first
+	# walked without recursion so deeply stuffed bags can't hit the recursion limit
+	def walk(self, max_depth=None):
+		stack = [(0, self)]
+		while len(stack) > 0:
+			depth, entity = stack.pop()
+			yield depth, entity
+			if max_depth == None or depth < max_depth:
+				stack.extend((depth + 1, e) for e in reversed(entity.contents))
+
+	def get_outline_line(self, depth, show_id=False):
+		line = "> " * depth + self.entity_name
+		if self.quantity > 1:
+			line += " (x" + str(self.quantity) + ")"
+		if show_id:
+			line += " #" + str(self.entity_id)
+		return line
+
+	def to_string(self):
+		return "".join(entity.get_outline_line(depth) + "\n" for depth, entity in self.walk())
 
 class EntityBag(Entity):
+	__slots__ = ()
+
+	default_description = "A bag to stuff a handful of things in."
+	default_max_contents = 10
+
 	def __init__(self):
-		super().__init__("bag", description="A bag to stuff a handful of things in.")
-		self.max_contents = 10
+		super().__init__("bag")
 		
 	async def action(self, interface, user, args):
 		arg = " ".join(args).lower()
@@ -294,12 +831,12 @@ class EntityBag(Entity):
 		elif arg == "poke":
 			await interface.print(user.name + " slightly depresses the fabric of the bag with their poking and prodding.")
 		elif arg == "eat":
-			if len(self.contents) > 2:
+			if self.item_count > 2:
 				await interface.print(user.name + " tries to stuff the bag in their mouth, but it's too full to fit.")
 			else:
 				await interface.print(user.name + " stuffs the bag in their mouth.  It tastes like fabric.")
 		elif arg == "punch":
-			if len(self.contents) > 0:
+			if self.item_count > 0:
 				await interface.print(user.name + " uses the bag as a punching bag, disturbing the contents a little.")
 			else:
 				await interface.print(user.name + " tries to use the bag as a punching bag, but it doesn't resist too well since there's nothing in it.")
@@ -310,10 +847,23 @@ class EntityBag(Entity):
 		return "The bag looks like it can fit " + str(self.remaining_space()) + " more things inside."
 
 class EntityNote(Entity):
+	__slots__ = ("message",)
+
+	default_description = "A scratch peice of paper that can be written on."
+	default_max_contents = 0
+
 	def __init__(self):
-		super().__init__("note", description="A scratch peice of paper that can be written on.")
-		self.max_contents = 0
+		super().__init__("note")
 		self.message = ""
+
+	def get_state(self):
+		state = super().get_state()
+		state["message"] = self.message
+		return state
+
+	def __setstate__(self, state):
+		self.message = ""
+		super().__setstate__(state)
 		
 	async def action(self, interface, user, args):
 		arg = " ".join(args).lower()
@@ -359,33 +909,1302 @@ def create_thing(thing_name):
 	else:
 		return Entity(thing_name)
 
-def get_mini_fridge(user_id):
-	entity = mini_fridges.get_entity_implicit(user_id)
-	entity.fridge = True
-	entity.private = True
-	entity.max_contents = 50
-	return entity
+# fridges by the discord ids they belong to
+# such as ("user", user id), ("server", server id), or ("channel", channel id)
+fridge_registry = {}
+
+def register_fridge(entity):
+	if entity.fridge_key != None:
+		fridge_registry[entity.fridge_key] = entity
+
+# find the fridge with a key, or else adopt one from before fridges had keys
+# which were named after the user, server, or channel, or else make a new one
+def get_keyed_fridge(key, container, entity_name):
+	entity = fridge_registry.get(key)
+	if entity == None and database != None:
+		entity = database.load_fridge("fridge_key = ?", (fridge_key_string(key),))
+	if entity == None:
+		entity = container.get_entity(entity_name)
+		if entity == None and database != None:
+			entity = database.load_fridge("parent_id = ? AND name_key = ?", (container.entity_id, name_key(entity_name)))
+		if entity == None or entity.fridge_key != None:
+			entity = Entity(entity_name)
+			container.put_into(entity)
+		entity.fridge_key = key
+		register_fridge(entity)
+		name_index.add_tree(entity)
+		return entity, True
+	if entity.entity_name != entity_name:
+		entity.rename(entity_name)
+	return entity, False
+
+def get_mini_fridge(user):
+	entity, new = get_keyed_fridge(("user", user.id), mini_fridges, str(user))
+	if new:
+		entity.fridge = True
+		entity.private = True
+		entity.max_contents = 50
+		record_mutation(entity)
+	return use_fridge(entity)
 
 def get_server_fridge(server):
-	return server_fridges.get_entity_implicit(server)
+	entity, new = get_keyed_fridge(("server", server.id), server_fridges, str(server))
+	if new:
+		record_mutation(entity)
+	return entity
 
-def get_channel_fridge(server, channel):
-	entity = get_server_fridge(server).get_entity_implicit(channel)
-	entity.fridge = True
-	entity.private = False
-	entity.max_contents = 200
+def get_channel_fridge(channel):
+	# skip looking up the server fridge when the channel fridge is already known
+	entity = fridge_registry.get(("channel", channel.id))
+	if entity != None and entity.entity_name == str(channel):
+		return use_fridge(entity)
+	entity, new = get_keyed_fridge(("channel", channel.id), get_server_fridge(channel.server), str(channel))
+	if new:
+		entity.fridge = True
+		entity.private = False
+		entity.max_contents = 200
+		record_mutation(entity)
+	return use_fridge(entity)
+
+# the database unloads the fridges that haven't been used in a while
+def use_fridge(entity):
+	if database != None:
+		database.touch(entity)
 	return entity
 
 def print_world():
 	print(root_entity.to_string())
 
-def save_world(save_file=save_file):
-	with open(save_file, "wb") as f:
-		pickle.dump(root_entity, f, pickle.HIGHEST_PROTOCOL)
+### Search Stuff ###
+
+# the trigrams of a name key, padded so short names and the ends of names count too
+def get_trigrams(key):
+	padded = "  " + key + " "
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# the key of the fridge something is in, the nearest one around it that belongs to a user, channel, or server
+def get_owner_key(entity):
+	container = entity.parent
+	while container != None and container.fridge_key == None:
+		container = container.parent
+	if container == None:
+		return None
+	return container.fridge_key
 
-def load_world(save_file=save_file):
+# an inverted index of the names of everything in the world, so things can be found without looking in every fridge
+# names are indexed by their trigrams so that names with typos in them still turn up
+# the entities with a name are kept by the fridge they're in, so a search only looks at the fridges it can see
+class NameIndex():
+	def __init__(self):
+		self.entities = {} # name key -> {fridge key -> {entity id: None}}
+		self.places = {} # entity id -> (name key, fridge key) it's indexed under
+		self.trigrams = {} # trigram -> name keys with it
+		self.trigram_counts = {} # name key -> how many trigrams it has
+
+	def add(self, entity, owner):
+		key = name_key(entity.entity_name)
+		place = (key, owner)
+		old_place = self.places.get(entity.entity_id)
+		if old_place == place:
+			return
+		if old_place != None:
+			self.remove(entity)
+		self.places[entity.entity_id] = place
+		owners = self.entities.get(key)
+		if owners == None:
+			owners = self.entities[key] = {}
+			trigrams = get_trigrams(key)
+			self.trigram_counts[key] = len(trigrams)
+			for trigram in trigrams:
+				self.trigrams.setdefault(trigram, set()).add(key)
+		owners.setdefault(owner, {})[entity.entity_id] = None
+
+	# index an entity and everything inside of it again after it has moved or its fridge got a key
+	def add_tree(self, entity):
+		stack = [(entity, get_owner_key(entity))]
+		while len(stack) > 0:
+			e, owner = stack.pop()
+			self.add(e, owner)
+			if e.fridge_key != None:
+				owner = e.fridge_key
+			stack.extend((content, owner) for content in e.contents)
+
+	def remove(self, entity):
+		place = self.places.pop(entity.entity_id, None)
+		if place == None:
+			return
+		key, owner = place
+		owners = self.entities[key]
+		entities = owners[owner]
+		del entities[entity.entity_id]
+		if len(entities) == 0:
+			del owners[owner]
+		if len(owners) == 0:
+			del self.entities[key]
+			del self.trigram_counts[key]
+			for trigram in get_trigrams(key):
+				keys = self.trigrams[trigram]
+				keys.discard(key)
+				if len(keys) == 0:
+					del self.trigrams[trigram]
+
+	# whether a thing that isn't a fridge has a name key in the fridges with the owner keys given, or in any fridge if that's None
+	def has_things(self, key, owners=None):
+		by_owner = self.entities.get(key, {})
+		if owners == None:
+			owners = list(by_owner)
+		for owner in owners:
+			for entity_id in by_owner.get(owner, ()):
+				if world_entities[entity_id].fridge_key == None:
+					return True
+		return False
+
+	# the name key of entity_name if anything is called that
+	# otherwise the limit name keys most like it, most similar first
+	# only names of things in the fridges with the owner keys given count, or in every fridge if that's None
+	def search(self, entity_name, limit, owners=None):
+		key = name_key(entity_name)
+		if self.has_things(key, owners):
+			return [key]
+		trigrams = get_trigrams(key)
+		shared = collections.Counter()
+		for trigram in trigrams:
+			shared.update(self.trigrams.get(trigram, ()))
+		found = []
+		for other, count in shared.items():
+			similarity = 2 * count / (len(trigrams) + self.trigram_counts[other])
+			if similarity >= find_similarity:
+				found.append((-similarity, other))
+		# only as many of them are sorted as it takes to find limit that count
+		heapq.heapify(found)
+		keys = []
+		while len(found) > 0 and len(keys) < limit:
+			similarity, other = heapq.heappop(found)
+			if self.has_things(other, owners):
+				keys.append(other)
+		return keys
+
+	# the entities with a name key in the fridges with the owner keys given, or in every fridge if that's None
+	def get_entities(self, key, owners=None):
+		by_owner = self.entities.get(key, {})
+		if owners == None:
+			owners = list(by_owner)
+		return [world_entities[entity_id] for owner in owners for entity_id in by_owner.get(owner, ())]
+
+name_index = NameIndex()
+
+### Persistence Stuff ###
+
+# every entity in Fridgeverse by entity id
+world_entities = {}
+next_entity_id = 1
+
+# changes that haven't been committed to the journal yet
+journal_records = []
+# sequence number of the last committed journal entry
+journal_sequence = 0
+# number of journal entries since the last snapshot
+journal_length = 0
+# changes are only recorded once the world has been loaded
+journaling = False
+
+def in_world(entity):
+	return entity.entity_id != None and world_entities.get(entity.entity_id) is entity
+
+# give ids to an entity and everything inside of it and keep track of them
+# returns how many entities didn't have ids yet
+def register_entity(entity):
+	global next_entity_id
+	assigned = 0
+	stack = [(entity, get_owner_key(entity))]
+	while len(stack) > 0:
+		e, owner = stack.pop()
+		if getattr(e, "entity_id", None) == None:
+			e.entity_id = next_entity_id
+			assigned += 1
+		next_entity_id = max(next_entity_id, e.entity_id + 1)
+		world_entities[e.entity_id] = e
+		register_fridge(e)
+		name_index.add(e, owner)
+		if e.fridge_key != None:
+			owner = e.fridge_key
+		stack.extend((content, owner) for content in reversed(list(e.contents)))
+	return assigned
+
+def unregister_entity(entity):
+	stack = [entity]
+	while len(stack) > 0:
+		e = stack.pop()
+		world_entities.pop(e.entity_id, None)
+		name_index.remove(e)
+		if e.fridge_key != None and fridge_registry.get(e.fridge_key) is e:
+			del fridge_registry[e.fridge_key]
+		stack.extend(e.contents)
+
+# move amount things from a stack into dest, into a stack inside of dest, or out of the world if dest is None
+# nothing is recorded here, move_many records the whole move at once
+# returns the entity that moved, which is a new one if the stack was split
+def move_part(entity, amount, dest, stack=None, new_id=None):
+	if amount < entity.quantity:
+		entity.parent.change_count(-amount)
+		entity.quantity -= amount
+		piece = entity.copy(amount)
+		piece.entity_id = new_id
+	else:
+		entity.parent.remove_content(entity)
+		piece = entity
+	if stack != None:
+		stack.quantity += amount
+		dest.change_count(amount)
+		if piece is entity:
+			unregister_entity(entity)
+	elif dest == None:
+		if piece is entity:
+			unregister_entity(entity)
+	else:
+		if in_world(dest):
+			register_entity(piece)
+		elif piece is entity:
+			unregister_entity(entity)
+		dest.add_content(piece)
+	return piece
+
+# the state of an entity not including where it is or what is inside of it
+def get_entity_state(entity):
+	return entity.get_state()
+
+# entity is about to be put into parent
+def record_move(entity, parent):
+	if not in_world(parent):
+		if in_world(entity):
+			record_destroy(entity)
+	elif in_world(entity):
+		if journaling:
+			journal_records.append(("move", entity.entity_id, parent.entity_id))
+	else:
+		register_entity(entity)
+		if journaling:
+			journal_records.append(("create", parent.entity_id, encode_entity(entity), entity.entity_id))
+
+# entity has been taken out of the world
+def record_destroy(entity):
+	if in_world(entity):
+		unregister_entity(entity)
+		if journaling:
+			journal_records.append(("destroy", entity.entity_id))
+
+# something about entity has changed
+def record_mutation(entity):
+	if journaling and in_world(entity):
+		journal_records.append(("mutate", entity.entity_id, get_entity_state(entity)))
+
+def apply_record(record):
+	kind = record[0]
+	# records are applied exactly as they happened, without stacking things again
+	# and the ones the snapshot already has are skipped, since replaying them again would make copies
+	# everything a record refers to is looked up before anything changes, so a record about a missing entity changes nothing
+	if kind == "create":
+		entity = decode_entity(record[2])
+		if entity.entity_id in world_entities:
+			return
+		parent = world_entities[record[1]]
+		register_entity(entity)
+		parent.add_content(entity)
+	elif kind == "move":
+		entity = world_entities.get(record[1])
+		parent = world_entities.get(record[2])
+		if entity == None or parent == None or entity.parent is parent:
+			return
+		if entity.parent != None:
+			entity.parent.remove_content(entity)
+		parent.add_content(entity)
+	elif kind == "destroy":
+		entity = world_entities[record[1]]
+		if entity.parent != None:
+			entity.parent.remove_content(entity)
+		unregister_entity(entity)
+	elif kind == "move_many":
+		if record[1] == None:
+			dest = None
+		else:
+			dest = world_entities[record[1]]
+		parts = []
+		for entity_id, amount, new_id, stack_id in record[2]:
+			if stack_id == None:
+				stack = None
+			else:
+				stack = world_entities[stack_id]
+			parts.append((world_entities[entity_id], amount, stack, new_id))
+		for entity, amount, stack, new_id in parts:
+			move_part(entity, amount, dest, stack, new_id)
+	elif kind == "schedule":
+		tick_scheduler.add((record[3], record[1], record[2], record[4]))
+	elif kind == "unschedule":
+		tick_scheduler.remove(record[1])
+	elif kind == "mutate":
+		entity = world_entities[record[1]]
+		state = record[2]
+		parent = entity.parent
+		if parent != None and state["entity_name"] != entity.entity_name:
+			parent.remove_content(entity)
+			entity.update_state(state)
+			parent.add_content(entity)
+		else:
+			if parent != None:
+				parent.change_count(state["quantity"] - entity.quantity)
+			fridge_key = entity.fridge_key
+			entity.update_state(state)
+			if entity.fridge_key != fridge_key:
+				name_index.add_tree(entity)
+		register_fridge(entity)
+
+# write a batch of (sequence, records) entries to the end of the journal
+# if that fails, whatever was written of them is cut off again so they can be written again later
+def append_journal(entries, journal_file=journal_file):
+	with open(journal_file, "ab") as f:
+		end = f.tell()
+		try:
+			if end == 0:
+				f.write(journal_magic)
+			for entry in entries:
+				f.write(encode_journal_entry(entry))
+			f.flush()
+			if journal_fsync:
+				os.fsync(f.fileno())
+		except BaseException:
+			f.truncate(end)
+			raise
+
+# read all of the complete entries in the journal
+# a partially written entry at the end is cut off
+# journals pickled by older versions of Fridge Bot are only read when converting them, since loading a pickle can run anything
+def load_journal(journal_file=journal_file, allow_pickle=False):
+	entries = []
+	if not os.path.exists(journal_file):
+		return entries
+	with open(journal_file, "r+b") as f:
+		magic = f.read(len(journal_magic))
+		if magic != journal_magic:
+			if journal_magic.startswith(magic): # empty, or cut off before the first entry
+				f.truncate(0)
+				return entries
+			if not allow_pickle:
+				raise ValueError(journal_file + " was pickled by an older Fridge Bot, convert it with --convert-pickle first")
+			f.seek(0)
+			return load_pickled_journal(f)
+		good = f.tell()
+		while True:
+			header = f.read(journal_frame.size)
+			if len(header) == 0:
+				break
+			try:
+				size, checksum = journal_frame.unpack(header)
+				data = f.read(size)
+				if len(data) < size or zlib.crc32(data) != checksum:
+					raise ValueError("the entry is cut off")
+				entries.append(decode_journal_entry(data))
+				good = f.tell()
+			except Exception:
+				print("Discarding a partial entry at the end of the journal.")
+				f.truncate(good)
+				break
+	return entries
+
+# the entries of a journal from before journals were encoded like snapshots
+# the things they create are encoded again the way they are now
+def load_pickled_journal(f):
+	entries = []
+	while True:
+		try:
+			sequence, records = pickle.load(f)
+		except EOFError:
+			break
+		except Exception:
+			print("Discarding a partial entry at the end of the journal.")
+			break
+		for i, record in enumerate(records):
+			if record[0] == "create":
+				records[i] = (record[0], record[1], encode_entity(pickle.loads(record[2])), record[3])
+		entries.append((sequence, records))
+	return entries
+
+def is_pickled_journal(journal_file=journal_file):
+	if not os.path.exists(journal_file):
+		return False
+	with open(journal_file, "rb") as f:
+		magic = f.read(len(journal_magic))
+	return not journal_magic.startswith(magic)
+
+# replay the journal on top of the loaded snapshot
+# records about entities that aren't in the world are skipped, so a damaged journal doesn't keep Fridge Bot from starting
+def replay_journal(allow_pickle=False):
+	global journal_sequence, journal_length
+	for sequence, records in load_journal(journal_file, allow_pickle):
+		if sequence <= journal_sequence:
+			continue
+		for record in records:
+			try:
+				apply_record(record)
+			except KeyError as e:
+				print("Skipping a " + record[0] + " in journal entry " + str(sequence) + ", entity " + str(e) + " isn't in Fridgeverse.")
+		journal_sequence = sequence
+		journal_length += 1
+
+# drop the journal entries that are already in the save file
+# returns how many entries are left
+def compact_journal(sequence, journal_file=journal_file):
+	entries = [entry for entry in load_journal(journal_file) if entry[0] > sequence]
+	temp_file = journal_file + ".tmp"
+	with open(temp_file, "wb") as f:
+		if len(entries) > 0:
+			f.write(journal_magic)
+		for entry in entries:
+			f.write(encode_journal_entry(entry))
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(temp_file, journal_file)
+	return len(entries)
+
+# bundle up the uncommitted changes into the next journal entry
+def seal_journal():
+	global journal_sequence
+	journal_sequence += 1
+	entry = (journal_sequence, list(journal_records))
+	del journal_records[:]
+	return entry
+
+# the world and its timers as they are right now, as (rows, timers) for write_snapshot
+# copying them is much quicker than encoding them, so the encoding can happen off of the event loop while the world changes
+# the copy is a lot of new tuples and no garbage, so the garbage collector is kept from going over the whole world while it's made
+def copy_world():
+	collecting = gc.isenabled()
+	gc.disable()
+	try:
+		return list(get_world_rows(root_entity)), tick_scheduler.get_timers()
+	finally:
+		if collecting:
+			gc.enable()
+
+# the snapshot is streamed straight into the file from the world as it is, unless it has been copied with copy_world already
+# every process and thread writing one has its own temporary file
+# and a snapshot that finishes after a newer one doesn't replace it
+# returns whether the save file was replaced
+def write_snapshot(save_file, sequence, world=None):
+	temp_file = "%s.%d-%d.tmp" % (save_file, os.getpid(), threading.get_ident())
+	with open(temp_file, "wb") as f:
+		if world == None:
+			world = (get_world_rows(root_entity), tick_scheduler.get_timers())
+		encode_world(f, sequence, *world)
+		f.flush()
+		os.fsync(f.fileno())
+	if get_snapshot_sequence(save_file) > sequence:
+		os.remove(temp_file)
+		return False
+	os.replace(temp_file, save_file)
+	return True
+
+# write the whole world to the save file and start a fresh journal right now
+# only for when nothing else is being saved, like at startup and shutdown
+def snapshot_world(save_file=save_file):
+	global journal_length
+	if len(journal_records) > 0:
+		append_journal([seal_journal()])
+	write_snapshot(save_file, journal_sequence)
+	with open(journal_file, "wb"):
+		pass
+	journal_length = 0
+
+# writes journal entries with whichever storage backend is in use
+def write_entries(entries):
+	if database != None:
+		database.write(entries)
+	else:
+		append_journal(entries)
+
+### Snapshot Stuff ###
+
+# the save file is a flat table of entities instead of a pickle of them
+# so it loads quickly, doesn't care if classes are renamed, and can't run anything when it's loaded
+# after the header, the file is a series of chunks:
+#   strings: new entries for the string table, which everything else refers to by index, 0 being None
+#   entities: fixed size rows, each one after its parent, which is referred to by its row
+#   extras: the attributes an entity only has when they aren't the default, and the slots of Entity subclasses
+#   timers: the timers waiting to go off
+# chunks are written every snapshot_chunk_rows entities, so neither end needs the whole file at once
+snapshot_magic = b"FRIDGEVS"
+snapshot_version = 1
+snapshot_chunk_rows = 10000
+snapshot_header = struct.Struct("<8sHHQ") # magic, version, unused, journal sequence
+snapshot_chunk = struct.Struct("<BII") # kind, rows, bytes
+snapshot_entity = struct.Struct("<IIIIIIdId") # kind, parent row, entity id, name, quantity, creator, created time, last user, last used
+snapshot_extra = struct.Struct("<II") # row, attribute name, followed by the value
+snapshot_timer = struct.Struct("<dQII") # time, timer id, entity id, callback name
+chunk_end, chunk_strings, chunk_entities, chunk_extras, chunk_timers = range(5)
+no_parent_row = 0xFFFFFFFF
+
+# what entities are called in snapshots and the database
+entity_types = {"Entity": Entity, "EntityBag": EntityBag, "EntityNote": EntityNote}
+
+# the slots a kind of entity has on top of the ones every Entity has
+def get_subclass_slots(entity_type):
+	return [name for cls in entity_type.__mro__ if cls not in (Entity, object) for name in cls.__dict__.get("__slots__", ())]
+
+# the attributes that can be set from the extras of a snapshot
+snapshot_attributes = {entity_type: frozenset(Entity.extra_attributes + get_subclass_slots(entity_type)) for entity_type in entity_types.values()}
+
+# times that aren't set are stored as NaN
+def time_to_float(value):
+	if value == None:
+		return float("nan")
+	return value
+
+def float_to_time(value):
+	if value != value:
+		return None
+	return value
+
+# strings are written as all of their lengths and then all of them
+def encode_strings(strings):
+	encoded = [string.encode("utf-8", "surrogatepass") for string in strings]
+	return struct.pack("<%dI" % len(encoded), *[len(string) for string in encoded]) + b"".join(encoded)
+
+# add count strings starting at offset in data to the end of strings
+# returns the offset after them
+def decode_strings(data, offset, count, strings):
+	lengths = struct.unpack_from("<%dI" % count, data, offset)
+	offset += 4 * count
+	for length in lengths:
+		strings.append(data[offset:offset + length].decode("utf-8", "surrogatepass"))
+		offset += length
+	return offset
+
+value_index = struct.Struct("<I")
+value_int = struct.Struct("<q")
+value_float = struct.Struct("<d")
+
+# encodes values with the strings in them kept in a table
+class ValueEncoder():
+	def __init__(self):
+		self.strings = {None: 0}
+		self.new_strings = []
+
+	def intern(self, string):
+		index = self.strings.get(string)
+		if index == None:
+			index = len(self.strings)
+			self.strings[string] = index
+			self.new_strings.append(string)
+		return index
+
+	# extra values are a type byte followed by the value
+	def encode_value(self, value, data):
+		kind = type(value)
+		if kind is str:
+			data.append(5)
+			data += value_index.pack(self.intern(value))
+		elif value is None:
+			data.append(0)
+		elif kind is bool:
+			data.append(2 if value else 1)
+		elif kind is int:
+			data.append(3)
+			data += value_int.pack(value)
+		elif kind is float:
+			data.append(4)
+			data += value_float.pack(value)
+		elif kind is tuple:
+			data.append(6)
+			data.append(len(value))
+			for item in value:
+				self.encode_value(item, data)
+		elif kind is list:
+			data.append(7)
+			data += value_index.pack(len(value))
+			for item in value:
+				self.encode_value(item, data)
+		elif kind is dict:
+			data.append(8)
+			data += value_index.pack(len(value))
+			for key, item in value.items():
+				self.encode_value(key, data)
+				self.encode_value(item, data)
+		elif kind is bytes:
+			data.append(9)
+			data += value_index.pack(len(value))
+			data += value
+		else:
+			raise TypeError("can't put a " + kind.__name__ + " in a snapshot")
+
+class SnapshotWriter(ValueEncoder):
+	def __init__(self, f, sequence):
+		super().__init__()
+		self.f = f
+		f.write(snapshot_header.pack(snapshot_magic, snapshot_version, 0, sequence))
+
+	def write_chunk(self, kind, count, data):
+		self.f.write(snapshot_chunk.pack(kind, count, len(data)))
+		self.f.write(data)
+
+	# the strings are written before the rows that use them
+	def write_rows(self, kind, count, data):
+		if len(self.new_strings) > 0:
+			self.write_chunk(chunk_strings, len(self.new_strings), encode_strings(self.new_strings))
+			self.new_strings = []
+		if count > 0:
+			self.write_chunk(kind, count, data)
+
+	# write the rows from get_world_rows
+	def write_world(self, world_rows):
+		rows = bytearray()
+		extras = bytearray()
+		count = 0
+		extra_count = 0
+		# the kind of entity, its id, its creator, and when it was created never change, so they aren't copied
+		for row, (entity, parent_row, name, quantity, last_user, last_used, values) in enumerate(world_rows):
+			rows += snapshot_entity.pack(self.intern(type(entity).__name__), parent_row, entity.entity_id, self.intern(name), quantity, self.intern(entity.creator), time_to_float(entity.created_time), self.intern(last_user), time_to_float(last_used))
+			count += 1
+			if values != None:
+				for name, value in values:
+					extras += snapshot_extra.pack(row, self.intern(name))
+					self.encode_value(value, extras)
+					extra_count += 1
+			if count == snapshot_chunk_rows:
+				self.write_rows(chunk_entities, count, rows)
+				self.write_rows(chunk_extras, extra_count, extras)
+				rows = bytearray()
+				extras = bytearray()
+				count = 0
+				extra_count = 0
+		self.write_rows(chunk_entities, count, rows)
+		self.write_rows(chunk_extras, extra_count, extras)
+
+	def write_timers(self, timers):
+		for start in range(0, len(timers), snapshot_chunk_rows):
+			data = b"".join(snapshot_timer.pack(at, timer_id, entity_id, self.intern(callback)) for at, timer_id, entity_id, callback in timers[start:start + snapshot_chunk_rows])
+			self.write_rows(chunk_timers, len(data) // snapshot_timer.size, data)
+
+	def finish(self):
+		self.write_chunk(chunk_end, 0, b"")
+
+# an entity and everything inside of it, outermost first, each after its parent
+# as (entity, parent row, name, quantity, last user, last used, extra values or None)
+# with everything about the entity that can change, so a list of them is a copy of the world as it was
+def get_world_rows(root):
+	subclass_slots = {}
+	stack = [(no_parent_row, root)]
+	row = 0
+	while len(stack) > 0:
+		parent_row, entity = stack.pop()
+		slots = subclass_slots.get(type(entity))
+		if slots == None:
+			slots = subclass_slots[type(entity)] = get_subclass_slots(type(entity))
+		values = entity._extra
+		if values != None:
+			values = list(values.items())
+		if len(slots) > 0:
+			values = (values or []) + [(name, getattr(entity, name)) for name in slots]
+		yield (entity, parent_row, entity.entity_name, entity.quantity, entity.last_user, entity.last_used, values)
+		stack.extend(zip(itertools.repeat(row), reversed(entity.contents)))
+		row += 1
+
+def encode_world(f, sequence, world_rows, timers):
+	writer = SnapshotWriter(f, sequence)
+	writer.write_world(world_rows)
+	writer.write_timers(timers)
+	writer.finish()
+
+def encode_snapshot(f, root, sequence, timers):
+	encode_world(f, sequence, get_world_rows(root), timers)
+
+# things created in the journal are written as snapshots of their own
+def encode_entity(entity):
+	f = io.BytesIO()
+	encode_snapshot(f, entity, 0, [])
+	return f.getvalue()
+
+def decode_entity(data):
+	return decode_snapshot(io.BytesIO(data))[0]
+
+# the journal starts with journal_magic, and then every entry is its size, a crc32 of it, and the entry
+# an entry is a table of the strings in it followed by the entry encoded like the extras in a snapshot
+# so the journal can't run anything when it's loaded either, and a torn write at the end is noticed
+journal_magic = b"FRIDGEVJ"
+journal_frame = struct.Struct("<II") # bytes, crc32
+
+def encode_journal_entry(entry):
+	encoder = ValueEncoder()
+	value = bytearray()
+	encoder.encode_value(entry, value)
+	data = struct.pack("<I", len(encoder.new_strings)) + encode_strings(encoder.new_strings) + value
+	return journal_frame.pack(len(data), zlib.crc32(data)) + data
+
+def decode_journal_entry(data):
+	strings = [None]
+	offset = decode_strings(data, 4, struct.unpack_from("<I", data)[0], strings)
+	return decode_value(data, offset, strings)[0]
+
+def read_exactly(f, size):
+	data = f.read(size)
+	if len(data) < size:
+		raise ValueError("the snapshot is cut off")
+	return data
+
+def decode_value(data, offset, strings):
+	kind = data[offset]
+	offset += 1
+	if kind < 3:
+		return [None, False, True][kind], offset
+	elif kind == 3:
+		return struct.unpack_from("<q", data, offset)[0], offset + 8
+	elif kind == 4:
+		return struct.unpack_from("<d", data, offset)[0], offset + 8
+	elif kind == 5:
+		return strings[struct.unpack_from("<I", data, offset)[0]], offset + 4
+	elif kind == 6:
+		items = []
+		count = data[offset]
+		offset += 1
+		for i in range(count):
+			item, offset = decode_value(data, offset, strings)
+			items.append(item)
+		return tuple(items), offset
+	elif kind == 7:
+		items = []
+		count = struct.unpack_from("<I", data, offset)[0]
+		offset += 4
+		for i in range(count):
+			item, offset = decode_value(data, offset, strings)
+			items.append(item)
+		return items, offset
+	elif kind == 8:
+		items = {}
+		count = struct.unpack_from("<I", data, offset)[0]
+		offset += 4
+		for i in range(count):
+			key, offset = decode_value(data, offset, strings)
+			items[key], offset = decode_value(data, offset, strings)
+		return items, offset
+	elif kind == 9:
+		size = struct.unpack_from("<I", data, offset)[0]
+		offset += 4
+		return bytes(data[offset:offset + size]), offset + size
+	raise ValueError("unknown kind of value in the snapshot")
+
+# read a snapshot a chunk at a time
+# returns the root entity, the sequence number of the last journal entry it includes, and the timers
+def decode_snapshot(f):
+	magic, version, unused, sequence = snapshot_header.unpack(read_exactly(f, snapshot_header.size))
+	if magic != snapshot_magic:
+		raise ValueError("not a Fridgeverse snapshot")
+	if version > snapshot_version:
+		raise ValueError("the snapshot is version " + str(version) + ", which is newer than this Fridge Bot understands")
+	strings = [None]
+	kinds = {} # string index -> entity type
+	entities = []
+	timers = []
+	while True:
+		kind, count, size = snapshot_chunk.unpack(read_exactly(f, snapshot_chunk.size))
+		data = read_exactly(f, size)
+		if kind == chunk_end:
+			break
+		elif kind == chunk_strings:
+			decode_strings(data, 0, count, strings)
+		elif kind == chunk_entities:
+			# entities are put together here instead of with __init__, since there can be millions of them
+			for type_index, parent_row, entity_id, name, quantity, creator, created_time, last_user, last_used in snapshot_entity.iter_unpack(data):
+				entity_type = kinds.get(type_index)
+				if entity_type == None:
+					entity_type = entity_types.get(strings[type_index])
+					if entity_type == None:
+						raise ValueError("unknown kind of entity in the snapshot: " + str(strings[type_index]))
+					kinds[type_index] = entity_type
+				entity = entity_type.__new__(entity_type)
+				entity.entity_name = name_table.intern(strings[name])
+				entity.parent = None
+				entity.entity_id = entity_id
+				entity.quantity = quantity
+				entity.item_count = 0
+				entity.version = 0
+				entity.creator = strings[creator]
+				entity.created_time = float_to_time(created_time)
+				entity.last_user = strings[last_user]
+				entity.last_used = float_to_time(last_used)
+				entity._name_index = None
+				entity._extra = None
+				if parent_row != no_parent_row:
+					entities[parent_row].add_content(entity)
+				entities.append(entity)
+		elif kind == chunk_extras:
+			offset = 0
+			for i in range(count):
+				row, name = snapshot_extra.unpack_from(data, offset)
+				value, offset = decode_value(data, offset + snapshot_extra.size, strings)
+				entity = entities[row]
+				name = strings[name]
+				if name not in snapshot_attributes[type(entity)]:
+					raise ValueError("unknown attribute in the snapshot: " + str(name))
+				setattr(entity, name, value)
+		elif kind == chunk_timers:
+			timers.extend((at, timer_id, entity_id, strings[callback]) for at, timer_id, entity_id, callback in snapshot_timer.iter_unpack(data))
+		# chunks of kinds added later are skipped
+	if len(entities) == 0:
+		raise ValueError("the snapshot has no world in it")
+	return entities[0], sequence, timers
+
+def is_snapshot(save_file):
+	with open(save_file, "rb") as f:
+		return f.read(len(snapshot_magic)) == snapshot_magic
+
+# the sequence number of the last journal entry in the snapshot in a save file, or -1 if there isn't one
+def get_snapshot_sequence(save_file):
+	try:
+		with open(save_file, "rb") as f:
+			magic, version, unused, sequence = snapshot_header.unpack(f.read(snapshot_header.size))
+	except (OSError, struct.error):
+		return -1
+	if magic != snapshot_magic:
+		return -1
+	return sequence
+
+### Database Stuff ###
+
+def fridge_key_string(key):
+	if key == None:
+		return None
+	return key[0] + ":" + str(key[1])
+
+# keeps Fridgeverse in an sqlite database with a row for every entity
+# the fridges of users and channels are only loaded once they're used
+# and the ones that haven't been used in a while are unloaded again
+class FridgeDatabase():
+	insert_row = "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?)"
+	delete_tree = """WITH RECURSIVE tree(id) AS (
+			SELECT ? UNION ALL SELECT entities.id FROM entities JOIN tree ON entities.parent_id = tree.id)
+		DELETE FROM entities WHERE id IN tree"""
+
+	def __init__(self, database_file=database_file):
+		self.connection = sqlite3.connect(database_file, isolation_level=None, check_same_thread=False)
+		self.lock = threading.Lock() # the connection writes are made with is shared with the persistence thread
+		self.loaded_fridges = collections.OrderedDict() # fridge -> last time it was used, least recent first
+		self.fridge_loads = 0
+		self.fridge_unloads = 0
+		with self.lock:
+			self.connection.execute("PRAGMA journal_mode = WAL")
+			self.connection.execute("PRAGMA synchronous = " + ("FULL" if journal_fsync else "NORMAL"))
+			self.connection.executescript("""
+				CREATE TABLE IF NOT EXISTS entities (
+					id INTEGER PRIMARY KEY,
+					parent_id INTEGER,
+					name_key TEXT NOT NULL,
+					fridge_key TEXT,
+					lazy INTEGER NOT NULL,
+					kind TEXT NOT NULL,
+					state BLOB NOT NULL);
+				CREATE INDEX IF NOT EXISTS entities_parent ON entities (parent_id, name_key);
+				CREATE INDEX IF NOT EXISTS entities_fridge_key ON entities (fridge_key);
+				CREATE TABLE IF NOT EXISTS timers (
+					id INTEGER PRIMARY KEY,
+					entity_id INTEGER NOT NULL,
+					at REAL NOT NULL,
+					callback TEXT NOT NULL);
+				CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);""")
+		# fridges are loaded on the event loop through a connection of its own
+		# so loading one never waits for the persistence thread to commit, since WAL lets readers carry on during a write
+		self.reader = sqlite3.connect(database_file, isolation_level=None)
+
+	@contextlib.contextmanager
+	def transaction(self):
+		with self.lock:
+			self.connection.execute("BEGIN")
+			try:
+				yield self.connection
+			except BaseException:
+				self.connection.execute("ROLLBACK")
+				raise
+			self.connection.execute("COMMIT")
+
+	# the reads in here all see the database as it was when the first one started
+	@contextlib.contextmanager
+	def reading(self):
+		self.reader.execute("BEGIN")
+		try:
+			yield self.reader
+		finally:
+			self.reader.execute("COMMIT")
+
+	def close(self):
+		self.reader.close()
+		with self.lock:
+			self.connection.close()
+
+	def is_empty(self):
+		with self.reading() as connection:
+			return connection.execute("SELECT id FROM entities LIMIT 1").fetchone() == None
+
+	# fridges are lazy, they and everything inside of them are left out until they're used
+	def row(self, entity):
+		if entity.parent == None:
+			parent_id = None
+		else:
+			parent_id = entity.parent.entity_id
+		state = pickle.dumps(entity.get_state(), pickle.HIGHEST_PROTOCOL)
+		return (entity.entity_id, parent_id, name_key(entity.entity_name), fridge_key_string(entity.fridge_key), int(entity.fridge), type(entity).__name__, state)
+
+	# write a whole world into the database, for new worlds and imported save files
+	# returns how many entities were written
+	def insert_world(self, root, sequence=0, timers=[]):
+		rows = []
+		stack = [root]
+		while len(stack) > 0:
+			entity = stack.pop()
+			rows.append(self.row(entity))
+			stack.extend(entity.contents)
+		with self.transaction() as connection:
+			connection.executemany(self.insert_row, rows)
+			connection.executemany("INSERT OR REPLACE INTO timers VALUES (?, ?, ?, ?)", [(timer_id, entity_id, at, callback) for at, timer_id, entity_id, callback in timers])
+			connection.execute("INSERT OR REPLACE INTO meta VALUES ('sequence', ?)", (sequence,))
+		return len(rows)
+
+	# make entities out of rows of (id, parent id, kind, state) and put them inside of each other
+	def build(self, rows):
+		entities = {}
+		for entity_id, parent_id, kind, state in rows:
+			entity_type = entity_types[kind]
+			entity = entity_type.__new__(entity_type)
+			entity.__setstate__(pickle.loads(state))
+			entities[entity_id] = entity
+		for entity_id, parent_id, kind, state in rows:
+			if parent_id in entities:
+				entities[parent_id].add_content(entities[entity_id])
+		return entities
+
+	# load everything except for the lazy fridges
+	# returns the root entity, the sequence number of the last entry written, and the highest entity id used
+	def load_world(self):
+		with self.reading() as connection:
+			rows = connection.execute("""
+				WITH RECURSIVE tree(id) AS (
+					SELECT id FROM entities WHERE parent_id IS NULL
+					UNION ALL SELECT entities.id FROM entities JOIN tree ON entities.parent_id = tree.id WHERE entities.lazy = 0)
+				SELECT id, parent_id, kind, state FROM entities WHERE id IN tree""").fetchall()
+			sequence = connection.execute("SELECT value FROM meta WHERE key = 'sequence'").fetchone()
+			last_id = connection.execute("SELECT MAX(id) FROM entities").fetchone()[0]
+		entities = self.build(rows)
+		root = next(entities[entity_id] for entity_id, parent_id, kind, state in rows if parent_id == None)
+		return root, sequence[0] if sequence != None else 0, last_id
+
+	# load the first lazy fridge matching an sql condition into the world along with everything inside of it
+	# returns None if there isn't one
+	def load_fridge(self, condition, parameters):
+		with self.reading() as connection:
+			found = connection.execute("SELECT id, parent_id FROM entities WHERE lazy = 1 AND " + condition + " LIMIT 1", parameters).fetchone()
+			if found == None:
+				return None
+			fridge_id, parent_id = found
+			if fridge_id in world_entities: # already loaded, but the change to it hasn't been written yet
+				return world_entities[fridge_id]
+			parent = world_entities.get(parent_id)
+			if parent == None:
+				return None
+			rows = connection.execute("""
+				WITH RECURSIVE tree(id) AS (
+					SELECT ? UNION ALL SELECT entities.id FROM entities JOIN tree ON entities.parent_id = tree.id)
+				SELECT id, parent_id, kind, state FROM entities WHERE id IN tree""", (fridge_id,)).fetchall()
+		fridge = self.build(rows)[fridge_id]
+		parent.add_content(fridge)
+		register_entity(fridge)
+		self.touch(fridge)
+		self.fridge_loads += 1
+		return fridge
+
+	# load the fridge an entity is in if it isn't loaded already
+	# returns the entity, or None if it doesn't exist anymore
+	def load_entity(self, entity_id):
+		with self.reading() as connection:
+			found = connection.execute("""
+				WITH RECURSIVE ancestors(id, parent_id, lazy) AS (
+					SELECT id, parent_id, lazy FROM entities WHERE id = ?
+					UNION ALL SELECT entities.id, entities.parent_id, entities.lazy FROM entities JOIN ancestors ON entities.id = ancestors.parent_id WHERE ancestors.lazy = 0)
+				SELECT id FROM ancestors WHERE lazy = 1""", (entity_id,)).fetchone()
+		if found != None:
+			self.load_fridge("id = ?", (found[0],))
+		return world_entities.get(entity_id)
+
+	# every timer as (at, timer id, entity id, callback name)
+	def load_timers(self):
+		with self.reading() as connection:
+			return [(at, timer_id, entity_id, callback) for timer_id, entity_id, at, callback in connection.execute("SELECT id, entity_id, at, callback FROM timers")]
+
+	def touch(self, fridge):
+		self.loaded_fridges[fridge] = time.time()
+		self.loaded_fridges.move_to_end(fridge)
+
+	# unload the fridges that haven't been used in a while once too many are loaded
+	# only once every change has been written, so nothing unloaded is still waiting to be saved
+	def unload_idle_fridges(self):
+		if persistence.queue_depth() > 0 or len(journal_records) > 0:
+			return
+		now = time.time()
+		while len(self.loaded_fridges) > max_loaded_fridges:
+			fridge, last_used = next(iter(self.loaded_fridges.items()))
+			if now - last_used < fridge_idle_time:
+				break
+			del self.loaded_fridges[fridge]
+			if in_world(fridge):
+				fridge.parent.remove_content(fridge)
+				unregister_entity(fridge)
+				# its version starts over when it's loaded again, so its listings can't be trusted after that
+				look_cache.pop((fridge.entity_id, False), None)
+				look_cache.pop((fridge.entity_id, True), None)
+				self.fridge_unloads += 1
+
+	# turn a journal entry into (sequence, ids to delete, rows to write, timers added, timers removed)
+	# done as soon as the entry is sealed, while the entities are still exactly as the records left them
+	def prepare(self, entry):
+		sequence, records = entry
+		touched = collections.OrderedDict()
+		scheduled = []
+		unscheduled = []
+		for record in records:
+			kind = record[0]
+			if kind == "schedule":
+				scheduled.append((record[1], record[2], record[3], record[4]))
+			elif kind == "unschedule":
+				unscheduled.append((record[1],))
+			elif kind == "create":
+				stack = [world_entities.get(record[3])]
+				touched[record[3]] = None
+				while len(stack) > 0:
+					entity = stack.pop()
+					if entity != None:
+						touched[entity.entity_id] = None
+						stack.extend(entity.contents)
+			elif kind == "move_many":
+				for entity_id, amount, new_id, stack_id in record[2]:
+					for touched_id in [entity_id, new_id, stack_id]:
+						if touched_id != None:
+							touched[touched_id] = None
+			else:
+				touched[record[1]] = None
+		deletes = []
+		rows = []
+		for entity_id in touched:
+			entity = world_entities.get(entity_id)
+			if entity == None:
+				deletes.append(entity_id)
+			else:
+				rows.append(self.row(entity))
+		return sequence, deletes, rows, scheduled, unscheduled
+
+	# write prepared entries together in one transaction
+	def write(self, entries):
+		with self.transaction() as connection:
+			for sequence, deletes, rows, scheduled, unscheduled in entries:
+				for entity_id in deletes:
+					connection.execute(self.delete_tree, (entity_id,))
+				connection.executemany(self.insert_row, rows)
+				connection.executemany("INSERT OR REPLACE INTO timers VALUES (?, ?, ?, ?)", scheduled)
+				connection.executemany("DELETE FROM timers WHERE id = ?", unscheduled)
+			connection.execute("INSERT OR REPLACE INTO meta VALUES ('sequence', ?)", (entries[-1][0],))
+
+database = None
+
+# keeps saving off of the event loop
+# journal entries that pile up while a write is happening are written together
+# and snapshots are taken at most max_save_staleness seconds after the world changes
+class PersistenceScheduler():
+	def __init__(self):
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) # keeps journal writes in order
+		self.snapshot_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) # writes snapshots and waits for the processes writing them
+		self.snapshot_pid = None # the process writing a snapshot right now
+		self.pending = [] # (entry, future) waiting to be written
+		self.writing = 0 # entries being written right now
+		self.writer = None # the task writing the pending entries, only ever one at a time
+		self.dirty_since = None
+		self.snapshot_task = None
+		self.journal_writes = 0
+		self.failed_writes = 0
+		self.journal_write_time = 0.0
+		self.saves = 0
+		self.failed_saves = 0
+		self.last_save_duration = 0.0
+		self.max_save_duration = 0.0
+		self.total_save_duration = 0.0
+
+	def queue_depth(self):
+		return len(self.pending) + self.writing
+
+	def mark_dirty(self):
+		if self.dirty_since == None:
+			self.dirty_since = time.time()
+		if self.snapshot_task == None:
+			self.snapshot_task = asyncio.ensure_future(self.snapshot_later())
+
+	# returns once the entry is safely in the journal
+	# entries already in the snapshot being taken don't make the world dirty
+	async def commit(self, entry, dirty=True):
+		future = asyncio.get_event_loop().create_future()
+		self.pending.append((entry, future))
+		if self.writer == None:
+			self.writer = asyncio.ensure_future(self.write_pending())
+		if database == None and dirty:
+			self.mark_dirty()
+		await future
+
+	async def write_pending(self):
+		global journal_length
+		loop = asyncio.get_event_loop()
+		try:
+			while len(self.pending) > 0:
+				batch = self.pending
+				self.pending = []
+				self.writing = len(batch)
+				start = time.perf_counter()
+				try:
+					await loop.run_in_executor(self.executor, write_entries, [entry for entry, future in batch])
+				except Exception as e:
+					# the world already has these changes and later entries build on them, so they can't be dropped
+					# they're written again, and the commands waiting on them wait until they are
+					self.failed_writes += 1
+					print("Failed to write the journal, trying again: " + str(e))
+					self.pending = batch + self.pending
+					await asyncio.sleep(journal_retry_delay)
+					continue
+				else:
+					journal_length += len(batch)
+					for entry, future in batch:
+						future.set_result(None)
+				finally:
+					self.writing = 0
+				self.journal_writes += 1
+				self.journal_write_time += time.perf_counter() - start
+		finally:
+			self.writer = None
+		if database != None:
+			database.unload_idle_fridges()
+
+	async def snapshot_later(self):
+		try:
+			while True:
+				wait = self.dirty_since + max_save_staleness - time.time()
+				if wait <= 0 or journal_length >= journal_compact_threshold:
+					break
+				await asyncio.sleep(min(wait, 1))
+			if not await self.snapshot():
+				await asyncio.sleep(snapshot_retry_delay)
+		finally:
+			self.snapshot_task = None
+		# changes made while the snapshot was being taken, or a snapshot that failed, need another one
+		if self.dirty_since != None:
+			self.mark_dirty()
+
+	# take a snapshot of the world as it is right now
+	# returns whether it was saved
+	async def snapshot(self):
+		global journal_length
+		loop = asyncio.get_event_loop()
+		# the changes not in the journal yet are sealed right before the world is copied, with nothing awaited in between
+		# so the snapshot holds exactly the entries up to its sequence number and none of them are replayed on top of it
+		entry = None
+		if len(journal_records) > 0:
+			entry = seal_journal()
+		sequence = journal_sequence
+		self.dirty_since = None
+		start = time.perf_counter()
+		try:
+			if snapshot_fork and hasattr(os, "fork"):
+				pid = os.fork()
+				if pid == 0:
+					# the child has its own copy of the world exactly as it is now
+					try:
+						write_snapshot(save_file, sequence)
+						os._exit(0)
+					except BaseException:
+						os._exit(1)
+				self.snapshot_pid = pid
+				if entry != None:
+					await self.commit(entry, False)
+				pid, status = await loop.run_in_executor(self.snapshot_executor, os.waitpid, pid, 0)
+				self.snapshot_pid = None
+				if status != 0:
+					raise RuntimeError("snapshot process exited with status " + str(status))
+			else:
+				# only copying the world happens on the event loop, encoding and writing it happen in a thread
+				world = copy_world()
+				if entry != None:
+					await self.commit(entry, False)
+				await loop.run_in_executor(self.snapshot_executor, write_snapshot, save_file, sequence, world)
+			remaining = await loop.run_in_executor(self.executor, compact_journal, sequence)
+		except Exception as e:
+			self.failed_saves += 1
+			print("Failed to save Fridgeverse: " + str(e))
+			if self.dirty_since == None:
+				self.dirty_since = time.time()
+			return False
+		journal_length = remaining
+		duration = time.perf_counter() - start
+		self.saves += 1
+		self.last_save_duration = duration
+		self.max_save_duration = max(self.max_save_duration, duration)
+		self.total_save_duration += duration
+		return True
+
+	# write out everything that is still waiting to be saved
+	# for use once the event loop has stopped
+	# a snapshot still being taken is finished first, so it can't replace the last one afterwards
+	def flush(self):
+		self.snapshot_executor.shutdown(wait=True)
+		if self.snapshot_pid != None:
+			try:
+				os.waitpid(self.snapshot_pid, 0)
+			except ChildProcessError: # it was already waited for
+				pass
+			self.snapshot_pid = None
+		self.executor.shutdown(wait=True)
+		entries = [entry for entry, future in self.pending]
+		self.pending = []
+		if database != None:
+			if len(journal_records) > 0:
+				entries.append(database.prepare(seal_journal()))
+			if len(entries) > 0:
+				database.write(entries)
+			database.close()
+			return
+		if len(journal_records) > 0:
+			entries.append(seal_journal())
+		if len(entries) > 0:
+			try:
+				append_journal(entries)
+			except Exception as e:
+				print("Failed to write the journal, the snapshot will have everything anyway: " + str(e))
+		snapshot_world()
+
+persistence = PersistenceScheduler()
+
+# commit the changes made by a command to the journal
+async def save_world():
+	if len(journal_records) > 0:
+		with command_metrics.phase("save"):
+			entry = seal_journal()
+			if database != None:
+				entry = database.prepare(entry)
+			await persistence.commit(entry)
+
+# returns the root entity, the sequence number of the last journal entry it includes, and the timers
+# save files from before snapshots are pickles, and are only loaded the old way when converting or importing them
+# since loading a pickle can run anything
+def load_world(save_file=save_file, allow_pickle=False):
 	with open(save_file, "rb") as f:
-		return pickle.load(f)
+		if f.read(len(snapshot_magic)) == snapshot_magic:
+			f.seek(0)
+			return decode_snapshot(f)
+		if not allow_pickle:
+			raise ValueError(save_file + " was pickled by an older Fridge Bot, convert it with --convert-pickle first")
+		f.seek(0)
+		world = pickle.load(f)
+	if isinstance(world, Entity): # old save files are just the root entity
+		return world, 0, []
+	return world["root"], world["sequence"], world.get("timers", [])
 
 def generate_world():
 	root_entity = Entity("Fridgeverse")
@@ -399,16 +2218,346 @@ def init_world():
 	global root_entity
 	global mini_fridges
 	global server_fridges
-	import os.path
-	if os.path.exists(save_file):
-		root_entity = load_world()
+	global journal_sequence
+	global journaling
+	global next_entity_id
+	global database
+	if storage_backend == "sqlite":
+		database = FridgeDatabase()
+		if database.is_empty():
+			root_entity = generate_world()
+			register_entity(root_entity)
+			database.insert_world(root_entity)
+		else:
+			root_entity, journal_sequence, last_id = database.load_world()
+			next_entity_id = last_id + 1
+			register_entity(root_entity)
+			tick_scheduler.load(database.load_timers())
+		assigned = 0
 	else:
-		root_entity = generate_world()
+		if os.path.exists(save_file):
+			root_entity, journal_sequence, timers = load_world()
+			tick_scheduler.load(timers)
+		else:
+			root_entity = generate_world()
+		assigned = register_entity(root_entity)
+		replay_journal()
 	mini_fridges = root_entity.get_entity("Mini Fridges")
 	server_fridges = root_entity.get_entity("Server Fridges")
+	journaling = True
+	if assigned > 0 or journal_length >= journal_compact_threshold:
+		snapshot_world()
+
+# copy the world in the save file and its journal into an empty database
+def import_world(save_file=save_file):
+	global journal_sequence
+	if not os.path.exists(save_file):
+		print("There is no " + save_file + " to import.")
+		return
+	import_database = FridgeDatabase()
+	try:
+		if not import_database.is_empty():
+			print(database_file + " already has a Fridgeverse in it.")
+			return
+		root, journal_sequence, timers = load_world(save_file, True)
+		tick_scheduler.load(timers)
+		register_entity(root)
+		replay_journal(True)
+		count = import_database.insert_world(root, journal_sequence, tick_scheduler.get_timers())
+		print("Imported " + str(count) + " entities from " + save_file + " into " + database_file + ".")
+	finally:
+		import_database.close()
+
+# a name for a copy of a file that isn't taken yet
+def get_backup_file(name):
+	backup_file = name + ".pickle"
+	number = 1
+	while os.path.exists(backup_file):
+		number += 1
+		backup_file = name + ".pickle." + str(number)
+	return backup_file
+
+# rewrite a pickled save file and the journal with it as a snapshot, keeping the pickles next to it
+def convert_world(save_file=save_file):
+	global journal_sequence
+	if not os.path.exists(save_file):
+		print("There is no " + save_file + " to convert.")
+		return
+	pickles = [name for name, pickled in [(save_file, not is_snapshot(save_file)), (journal_file, is_pickled_journal())] if pickled]
+	if len(pickles) == 0:
+		print(save_file + " is already a snapshot.")
+		return
+	root, journal_sequence, timers = load_world(save_file, True)
+	tick_scheduler.load(timers)
+	register_entity(root)
+	replay_journal(True)
+	backups = []
+	for name in pickles:
+		backups.append(get_backup_file(name))
+		shutil.copyfile(name, backups[-1])
+	write_snapshot(save_file, journal_sequence, (get_world_rows(root), tick_scheduler.get_timers()))
+	# the snapshot has everything that was in the journal
+	with open(journal_file, "wb"):
+		pass
+	count = sum(1 for depth, entity in root.walk())
+	print("Converted " + str(count) + " entities in " + " and ".join(pickles) + " to a snapshot, the pickles are kept in " + " and ".join(backups) + ".")
+
+### Timer Stuff ###
+
+# wakes entities up at the times they asked for, by calling a method of theirs by name
+# timers are kept in a heap ordered by when they're due, and cancelled ones are only dropped once they come up
+# so adding and cancelling a timer are both O(log n) at most, with a million of them waiting
+class TickScheduler():
+	def __init__(self):
+		self.heap = [] # (at, timer id, entity id, callback name)
+		self.timers = {} # timer id -> its entry in the heap, for the timers that haven't been cancelled
+		self.next_timer_id = 1
+		self.wake = None # set when a timer is added that's due sooner than the one being waited for
+		self.task = None
+		self.fired = 0
+		self.failed = 0
+
+	def get_timers(self):
+		return list(self.timers.values())
+
+	def load(self, timers):
+		self.heap = list(timers)
+		heapq.heapify(self.heap)
+		self.timers = {entry[1]: entry for entry in self.heap}
+		self.next_timer_id = max(self.timers, default=0) + 1
+
+	# add a timer without any record of it
+	def add(self, entry):
+		heapq.heappush(self.heap, entry)
+		self.timers[entry[1]] = entry
+		self.next_timer_id = max(self.next_timer_id, entry[1] + 1)
+		if self.wake != None and entry is self.heap[0]:
+			self.wake.set()
+
+	# remove a timer without any record of it
+	# the heap is rebuilt once it's mostly cancelled timers, so they can't pile up
+	def remove(self, timer_id):
+		if self.timers.pop(timer_id, None) != None and len(self.heap) > 2 * len(self.timers) + 1000:
+			self.heap = list(self.timers.values())
+			heapq.heapify(self.heap)
+
+	# call entity.callback_name() at the time at, which is like time.time()
+	# returns the timer id for cancelling it
+	def schedule(self, entity, at, callback_name):
+		entry = (at, self.next_timer_id, entity.entity_id, callback_name)
+		self.add(entry)
+		if journaling:
+			journal_records.append(("schedule", entry[1], entry[2], entry[0], entry[3]))
+		return entry[1]
+
+	def cancel(self, timer_id):
+		if timer_id in self.timers:
+			self.remove(timer_id)
+			if journaling:
+				journal_records.append(("unschedule", timer_id))
+
+	# take the timers that are due, up to count of them
+	def pop_due(self, now, count):
+		due = []
+		while len(self.heap) > 0 and self.heap[0][0] <= now and len(due) < count:
+			entry = heapq.heappop(self.heap)
+			if self.timers.get(entry[1]) is entry:
+				due.append(entry)
+		return due
+
+	def start(self):
+		if self.task == None:
+			self.task = asyncio.ensure_future(self.run())
+
+	async def run(self):
+		self.wake = asyncio.Event()
+		while True:
+			now = time.time()
+			due = self.pop_due(now, timer_batch_size)
+			if len(due) > 0:
+				await self.fire(due)
+				continue
+			# throw away cancelled timers at the top so the wait is for a real one
+			while len(self.heap) > 0 and self.timers.get(self.heap[0][1]) is not self.heap[0]:
+				heapq.heappop(self.heap)
+			self.wake.clear()
+			if len(self.heap) == 0:
+				await self.wake.wait()
+			else:
+				try:
+					await asyncio.wait_for(self.wake.wait(), self.heap[0][0] - now)
+				except asyncio.TimeoutError:
+					pass
+
+	# run a batch of timers, each with the lock of the fridge its entity is in, and save once at the end
+	async def fire(self, due):
+		for entry in due:
+			at, timer_id, entity_id, callback_name = entry
+			self.cancel(timer_id)
+			entity = world_entities.get(entity_id)
+			if entity == None and database != None:
+				entity = database.load_entity(entity_id)
+			if entity == None:
+				continue # it's gone from the world
+			keys = get_lock_keys(entity)
+			await fridge_locks.acquire(keys)
+			try:
+				result = getattr(entity, callback_name)()
+				if asyncio.iscoroutine(result):
+					await result
+				self.fired += 1
+			except Exception as e:
+				self.failed += 1
+				print("Timer " + str(timer_id) + " for " + entity.entity_name + " failed: " + repr(e))
+			finally:
+				fridge_locks.release(keys)
+		await save_world()
+
+tick_scheduler = TickScheduler()
+
+# call entity.callback_name() at the time at, even if Fridge Bot restarts in between
+def schedule(entity, at, callback_name):
+	return tick_scheduler.schedule(entity, at, callback_name)
+
+def cancel_timer(timer_id):
+	tick_scheduler.cancel(timer_id)
+
+# the lock of the user or channel fridge an entity is in
+def get_lock_keys(entity):
+	while entity != None and entity.fridge_key == None:
+		entity = entity.parent
+	if entity == None or entity.fridge_key[0] == "server":
+		return []
+	return [entity.fridge_key]
 
 ### Commands Stuff ###
 
+# how many times each command has run, how long it took, and what the time went to
+# phases are timed for every command running in the task, so a command that invokes another includes its time
+# only the innermost phase running is timed, so a print while changing things counts as printing and not changing things
+class CommandMetrics():
+	buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10] # upper bounds in seconds
+	phases = ["render", "mutate", "print", "save"]
+
+	def __init__(self):
+		self.commands = {} # command name -> metrics for it
+		self.active = {} # task -> phase times of the commands running in it, innermost last
+		self.running = {} # task -> [name, when it started being timed] of the innermost phase running in it
+		self.dump_task = None
+
+	def get(self, name):
+		metrics = self.commands.get(name)
+		if metrics == None:
+			metrics = {"count": 0, "errors": 0, "seconds": 0.0, "histogram": [0] * (len(self.buckets) + 1), "phases": dict.fromkeys(self.phases, 0.0)}
+			self.commands[name] = metrics
+		return metrics
+
+	def start(self):
+		frame = dict.fromkeys(self.phases, 0.0)
+		self.active.setdefault(current_task(), []).append(frame)
+		return frame
+
+	def finish(self, name, frame, start, failed):
+		seconds = time.perf_counter() - start
+		task = current_task()
+		frames = self.active[task]
+		frames.pop()
+		if len(frames) == 0:
+			del self.active[task]
+		metrics = self.get(name)
+		metrics["count"] += 1
+		if failed:
+			metrics["errors"] += 1
+		metrics["seconds"] += seconds
+		metrics["histogram"][bisect.bisect_left(self.buckets, seconds)] += 1
+		for phase in self.phases:
+			metrics["phases"][phase] += frame[phase]
+
+	# a phase named None isn't timed, like waiting for a reply
+	@contextlib.contextmanager
+	def phase(self, name):
+		task = current_task()
+		frames = self.active.get(task)
+		if frames == None:
+			yield
+			return
+		outer = self.running.get(task)
+		now = time.perf_counter()
+		if outer != None:
+			self.add_time(frames, outer, now)
+		self.running[task] = [name, now]
+		try:
+			yield
+		finally:
+			now = time.perf_counter()
+			self.add_time(frames, self.running[task], now)
+			if outer == None:
+				del self.running[task]
+			else:
+				outer[1] = now
+				self.running[task] = outer
+
+	def add_time(self, frames, running, now):
+		if running[0] != None:
+			for frame in frames:
+				frame[running[0]] += now - running[1]
+
+	# the upper bound of the histogram bucket where a fraction of the runs took less time
+	def get_percentile(self, metrics, fraction):
+		target = fraction * metrics["count"]
+		total = 0
+		for bound, count in zip(self.buckets + [float("inf")], metrics["histogram"]):
+			total += count
+			if total >= target:
+				return bound
+		return float("inf")
+
+	# prometheus text format
+	def get_text(self):
+		lines = ["# HELP fridge_command_seconds Time taken by commands.", "# TYPE fridge_command_seconds histogram"]
+		for name, metrics in sorted(self.commands.items()):
+			total = 0
+			for bound, count in zip(self.buckets + ["+Inf"], metrics["histogram"]):
+				total += count
+				lines.append('fridge_command_seconds_bucket{command="%s",le="%s"} %d' % (name, bound, total))
+			lines.append('fridge_command_seconds_sum{command="%s"} %f' % (name, metrics["seconds"]))
+			lines.append('fridge_command_seconds_count{command="%s"} %d' % (name, metrics["count"]))
+		lines += ["# HELP fridge_command_errors_total Commands that raised an error.", "# TYPE fridge_command_errors_total counter"]
+		for name, metrics in sorted(self.commands.items()):
+			lines.append('fridge_command_errors_total{command="%s"} %d' % (name, metrics["errors"]))
+		lines += ["# HELP fridge_command_phase_seconds_total Time commands spent rendering, printing, and saving.", "# TYPE fridge_command_phase_seconds_total counter"]
+		for name, metrics in sorted(self.commands.items()):
+			for phase in self.phases:
+				lines.append('fridge_command_phase_seconds_total{command="%s",phase="%s"} %f' % (name, phase, metrics["phases"][phase]))
+		lines += ["# TYPE fridge_lock_wait_seconds_total counter", "fridge_lock_wait_seconds_total %f" % fridge_locks.total_wait]
+		lines += ["# TYPE fridge_lock_contended_total counter", "fridge_lock_contended_total %d" % fridge_locks.contended]
+		lines += ["# TYPE fridge_save_queue_depth gauge", "fridge_save_queue_depth %d" % persistence.queue_depth()]
+		lines += ["# TYPE fridge_outbound_queue_depth gauge", "fridge_outbound_queue_depth %d" % outbound.queue_depth()]
+		lines += ["# TYPE fridge_log_queue_depth gauge", "fridge_log_queue_depth %d" % message_logger.queue_depth()]
+		return "\n".join(lines) + "\n"
+
+	# write the metrics to metrics_file every metrics_interval seconds
+	async def dump_periodically(self):
+		loop = asyncio.get_event_loop()
+		while True:
+			await asyncio.sleep(metrics_interval)
+			try:
+				await loop.run_in_executor(None, write_metrics, self.get_text(), metrics_file)
+			except Exception as e:
+				print("Failed to write metrics: " + str(e))
+
+	def start_dumping(self):
+		if metrics_file != None and self.dump_task == None:
+			self.dump_task = asyncio.ensure_future(self.dump_periodically())
+
+def write_metrics(text, metrics_file=metrics_file):
+	temp_file = metrics_file + ".tmp"
+	with open(temp_file, "w", encoding='UTF-8') as f:
+		f.write(text)
+	os.replace(temp_file, metrics_file)
+
+command_metrics = CommandMetrics()
+
 class Command():
 	def __init__(self, aliases, description="A generic command", command_class=CommandClass.common, help="There's no help for this command.", usage="", minimum_arguments=0):
 		self.aliases = aliases
@@ -427,7 +2576,14 @@ class Command():
 		elif len(args) < self.minimum_arguments:
 			await self.print_usage(interface)
 		else:
-			await self.action(interface, user, args)
+			start = time.perf_counter()
+			frame = command_metrics.start()
+			failed = True
+			try:
+				await self.action(interface, user, args)
+				failed = False
+			finally:
+				command_metrics.finish(self.aliases[0], frame, start, failed)
 
 	def get_description_string(self):
 		aliases = [bot_trigger + alias for alias in self.aliases]
@@ -437,14 +2593,14 @@ class Command():
 	def get_usage_string(self):
 		return "_Usage: " + bot_trigger + self.aliases[0] + " " + self.usage + "_"
 
+	def get_help_string(self):
+		return self.get_description_string() + "\n" + self.get_usage_string() + "\n\n" + self.help
+
 	async def print_usage(self, interface):
-		await interface.print(self.get_usage_string())
+		await interface.print(command_registry.get_strings(self)[1])
 
 	async def print_help(self, interface):
-		description_string = self.get_description_string()
-		usage_string = self.get_usage_string()
-		help_string = description_string + "\n" + usage_string + "\n\n" + self.help
-		await interface.print(help_string)
+		await interface.print(command_registry.get_strings(self)[2])
 
 	# virtual method
 	async def action(self, interface, user, args=[]):
@@ -464,7 +2620,10 @@ class StoryTestCommand(Command):
 	async def action(self, interface, user, args=[]):
 		await interface.print("yo yo yo, tell me a **fruit**")
 		response = await interface.read()
-		await interface.print("yeah yo, " + response + " is a _fantastic_ fruit")
+		if response == None:
+			await interface.print("yo, too slow")
+		else:
+			await interface.print("yeah yo, " + response + " is a _fantastic_ fruit")
 
 class ChannelIdCommand(Command):
 	def __init__(self):
@@ -480,26 +2639,87 @@ class UserIdCommand(Command):
 	async def action(self, interface, user, args=[]):
 		await interface.print("User ID: **" + user.id + "**")
 
+# outlines of the world being paged through, by cursor
+world_cursors = collections.OrderedDict()
+next_world_cursor = 1
+
 class WorldCommand(Command):
 	def __init__(self):
-		super().__init__(["world"], "Print an outline of all things in Fridgeverse.", CommandClass.admin)
+		super().__init__(["world"], "Print an outline of all things in Fridgeverse.", CommandClass.admin, "The world command prints an outline of everything in Fridgeverse, " + str(world_page_lines) + " lines at a time, with the entity id of each thing after its name.  If there is more to see, it gives a _cursor_ to pass along with \"more\" to see the next page.\n\nThe outline can be narrowed down with _depth=N_ to only go N things deep, _name=text_ to only show things with that text in their names, and _from=entity id_ to only outline what is inside of one thing.  If you pass \"file\", the whole outline is written to the file " + world_dump_file + " instead.", "{\"more\" [cursor] | \"file\"} {depth=N} {name=text} {from=entity id}")
 
 	async def action(self, interface, user, args=[]):
-		await interface.print(root_entity.to_string())
+		global next_world_cursor
+		if len(args) > 0 and args[0].lower() == "more":
+			if len(args) < 2 or args[1] not in world_cursors:
+				await interface.print("That outline isn't around anymore.")
+				return
+			cursor = args[1]
+			lines = world_cursors.pop(cursor)
+		else:
+			lines = self.get_lines(args)
+			if lines == None:
+				await self.print_usage(interface)
+				return
+			if len(args) > 0 and args[0].lower() == "file":
+				count = await self.write_file(lines)
+				await interface.print("Wrote " + str(count) + " lines to **" + world_dump_file + "**.")
+				return
+			cursor = str(next_world_cursor)
+			next_world_cursor += 1
+		page = list(itertools.islice(lines, world_page_lines))
+		for line in lines:
+			# there's more, so keep the rest of the outline for later
+			world_cursors[cursor] = itertools.chain([line], lines)
+			while len(world_cursors) > world_cursors_kept:
+				world_cursors.popitem(False)
+			page.append("_Say **" + bot_trigger + "world more " + cursor + "** to see more._")
+			break
+		if len(page) == 0:
+			page.append("Nothing matches that.")
+		await interface.print("\n".join(page))
+
+	# the lines of the outline that args ask for, or None if they don't make sense
+	def get_lines(self, args):
+		start = root_entity
+		max_depth = None
+		name = None
+		for arg in args:
+			key, equals, value = arg.partition("=")
+			key = key.lower()
+			if key == "file" and equals == "":
+				continue
+			elif key == "depth" and to_int(value) != None:
+				max_depth = to_int(value)
+			elif key == "name" and value != "":
+				name = name_key(value)
+			elif key == "from" and to_int(value) in world_entities:
+				start = world_entities[to_int(value)]
+			else:
+				return None
+		return (entity.get_outline_line(depth, True) for depth, entity in start.walk(max_depth) if name == None or name in name_key(entity.entity_name))
+
+	# write the lines a batch at a time, letting other commands run in between
+	async def write_file(self, lines):
+		loop = asyncio.get_event_loop()
+		count = 0
+		with open(world_dump_file, "w", encoding='UTF-8') as f:
+			while True:
+				batch = list(itertools.islice(lines, 10000))
+				if len(batch) == 0:
+					break
+				count += len(batch)
+				await loop.run_in_executor(None, f.write, "\n".join(batch) + "\n")
+		return count
 
 class CommandsCommand(Command):
 	def __init__(self):
 		super().__init__(["commands"], "List all recognized commands.", CommandClass.common, "The commands command prints a listing of all of the commands that Fridge Bot knows.  They are sorted first by _command class_ and then by _default alias_.  Listed for each command are its _command class_, a list of its _aliases_, and its _short description_.  Bolded for convenience are its _default alias_ and its _short description_.\n\nIf you invoke this command without any arguments, it will only list commands that you are allowed to invoke according to command class.  If you pass \"all\" as an argument, all of the commands will be listed, whether you can invoke them yourself or not.", "{\"all\"}")
 
 	async def action(self, interface, user, args=[]):
-		command_list = get_unique_commands()
 		if len(args) == 0 or args[0].lower() != "all":
-			command_list = [i for i in command_list if i.can_invoke(interface)]
-		lines = []
-		command_list.sort(key=lambda x: (x.command_class.value, x.aliases[0]))
-		for command in command_list:
-			lines.append(command.get_description_string())
-		await interface.print("\n".join(lines))
+			await interface.print(command_registry.get_listing(interface.get_permissions()))
+		else:
+			await interface.print(command_registry.get_listing())
 
 class HelpCommand(Command):
 	def __init__(self):
@@ -509,59 +2729,72 @@ class HelpCommand(Command):
 		if len(args) == 0:
 			await invoke_command(interface, user, "help", ["help"])
 		else:
-			command = args[0].lower()
-			if command in commands.keys():
-				await commands[command].print_help(interface)
+			command = command_registry.resolve(args[0])
+			if command != None:
+				await command.print_help(interface)
 			else:
 				await interface.print("Fridge Bot doesn't know about _" + args[0] + "_.")
 
+# listings of fridge contents by (fridge id, private) -> (fridge version, listing)
+# a listing is reused until the fridge's contents change
+look_cache = {}
+look_cache_stats = {"hits": 0, "misses": 0}
+
+# describe everything inside of a fridge
+def render_contents(fridge, fridge_name):
+	entity_counts = {}
+	for entity in fridge.contents:
+		entity_name = entity.entity_name
+		if entity_name in entity_counts.keys():
+			entity_counts[entity_name] += entity.quantity
+		else:
+			entity_counts[entity_name] = entity.quantity
+	entity_names = []
+	entity_keys = list(entity_counts.keys())
+	entity_keys.sort()
+	for entity_name in entity_keys:
+		entity_count = entity_counts[entity_name]
+		entry = name_table.get(entity_name)
+		if entity_count == 1:
+			entity_name = entry.article + " " + entity_name
+		elif entity_count > 1:
+			entity_name = str(entity_count) + " " + entry.plural
+		entity_name = "**" + entity_name + "**"
+		entity_names.append(entity_name)
+	if len(entity_names) > 2:
+		message = "Inside " + fridge_name + " are " + ", ".join(entity_names[:-1]) + ", and " + entity_names[-1] + "."
+	elif len(entity_names) > 1:
+		message = "Inside " + fridge_name + " are " + entity_names[0] + " and " + entity_names[1] + "."
+	elif len(entity_names) > 0:
+		if list(entity_counts.values())[0] > 1:
+			message = "Inside " + fridge_name + " are " + entity_names[0] + "."
+		else:
+			message = "Inside " + fridge_name + " is " + entity_names[0] + "."
+	else:
+		message = "Nothing is inside " + fridge_name + "!"
+	return message
+
 class LookCommand(Command):
 	def __init__(self):
 		super().__init__(["look", "see", "view", "contents", "fridge", "list", "dir", "ls", "open"], "See the contents of the fridge.", CommandClass.fridge, "The look command lists off all of the things in the fridge of the channel used to invoke the command.  If you invoke the command by direct message, you will see the contents of your _personal minifridge_.  If you invoke the command in a channel of a server, you will see the contents of the _channel fridge_ that is shared by every member of the channel.")
 
 	async def action(self, interface, user, args=[]):
-		if interface.channel.is_private:
-			fridge_name = "your minifridge"
-		else:
-			fridge_name = "the fridge"
-		entity_counts = {}
-		for entity in interface.get_fridge().contents:
-			entity_name = entity.entity_name
-			if entity_name in entity_counts.keys():
-				entity_counts[entity_name] += 1
+		fridge = interface.get_fridge()
+		private = interface.channel.is_private
+		with command_metrics.phase("render"):
+			cached = look_cache.get((fridge.entity_id, private))
+			if cached != None and cached[0] == fridge.version:
+				look_cache_stats["hits"] += 1
+				message = cached[1]
 			else:
-				entity_counts[entity_name] = 1
-		entity_names = []
-		entity_keys = list(entity_counts.keys())
-		entity_keys.sort()
-		for entity_name in entity_keys:
-			entity_count = entity_counts[entity_name]
-			if entity_count == 1:
-				if entity_name[0] in ["a", "e", "i", "o", "u"]:
-					entity_name = "an " + entity_name
-				else:
-					entity_name = "a " + entity_name
-			elif entity_count > 1:
-				entity_name = str(entity_count) + " " + entity_name
-				if entity_name[-1] in ["s", "x"]:
-					entity_name += "es"
-				elif entity_name[-1] == "y":
-					entity_name = entity_name[:-1] + "ies"
+				look_cache_stats["misses"] += 1
+				if private:
+					message = render_contents(fridge, "your minifridge")
 				else:
-					entity_name += "s"
-			entity_name = "**" + entity_name + "**"
-			entity_names.append(entity_name)
-		if len(entity_names) > 2:
-			message = "Inside " + fridge_name + " are " + ", ".join(entity_names[:-1]) + ", and " + entity_names[-1] + "."
-		elif len(entity_names) > 1:
-			message = "Inside " + fridge_name + " are " + entity_names[0] + " and " + entity_names[1] + "."
-		elif len(entity_names) > 0:
-			if list(entity_counts.values())[0] > 1:
-				message = "Inside " + fridge_name + " are " + entity_names[0] + "."
-			else:
-				message = "Inside " + fridge_name + " is " + entity_names[0] + "."
-		else:
-			message = "Nothing is inside " + fridge_name + "!"
+					message = render_contents(fridge, "the fridge")
+				if len(look_cache) >= look_cache_size:
+					look_cache.clear()
+				look_cache[(fridge.entity_id, private)] = (fridge.version, message)
 		await interface.print(message)
 
 class StoreCommand(Command):
@@ -574,41 +2807,33 @@ class StoreCommand(Command):
 		else:
 			amount = 1
 		entity_name = " ".join(args)
-		if amount <= 0:
+		if entity_name == "": # just an amount
+			await self.print_usage(interface)
+		elif amount <= 0:
 			await interface.print("Nothing happened.")
 		else:
-			if amount != 1:
-				if entity_name.endswith("ies"):
-					entity_name = entity_name[:-3] + "y"
-				elif entity_name.endswith("les"):
-					entity_name = entity_name[:-1]
-				elif entity_name.endswith("es"):
-					entity_name = entity_name[:-2]
-				elif entity_name.endswith("s"):
-					entity_name = entity_name[:-1]
-			count = get_mini_fridge(str(user)).count_entity(entity_name)
-			if count == 0:
+			entity_name = name_table.resolve(entity_name, amount)
+			mini_fridge = get_mini_fridge(user)
+			with command_metrics.phase("mutate"):
+				result = mini_fridge.move_many(entity_name, amount, interface.get_fridge())
+			if result == MoveResult.missing:
 				await interface.print("No such _" + entity_name + "_ is in " + user.name + "'s minifridge!")
-			elif amount > count:
-				await interface.print("There are only **" + str(count) + "** of **" + entity_name + "** in " + user.name + "'s minifridge!")
-			elif interface.get_fridge().is_full():
+			elif result == MoveResult.too_few:
+				await interface.print("There are only **" + str(mini_fridge.count_entity(entity_name)) + "** of **" + entity_name + "** in " + user.name + "'s minifridge!")
+			elif result == MoveResult.full:
 				await interface.print("The fridge is full and won't handle anymore things stuffed into it!")
-			elif interface.get_fridge().remaining_space() < amount:
+			elif result == MoveResult.too_full:
 				await interface.print("The fridge is too full to handle that many more things stuffed inside of it!")
+			elif result == MoveResult.glued:
+				await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
 			else:
-				for i in range(amount):
-					entity = get_mini_fridge(str(user)).get_entity(entity_name)
-					if not entity.movable:
-						await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
-						return
-					entity.put(interface.get_fridge())
+				await save_world()
 				if amount == 1:
 					determiner_word = "The"
 				else:
 					determiner_word = str(amount) + " of"
 				await interface.print(determiner_word + " " + entity_name + " was taken from " + user.name + "'s minifridge and put in the fridge.")
 				await invoke_command(interface, user, "look")
-				save_world()
 
 class TakeCommand(Command):
 	def __init__(self):
@@ -620,41 +2845,33 @@ class TakeCommand(Command):
 		else:
 			amount = 1
 		entity_name = " ".join(args)
-		if amount <= 0:
+		if entity_name == "": # just an amount
+			await self.print_usage(interface)
+		elif amount <= 0:
 			await interface.print("Nothing happened.")
 		else:
-			if amount != 1:
-				if entity_name.endswith("ies"):
-					entity_name = entity_name[:-3] + "y"
-				elif entity_name.endswith("les"):
-					entity_name = entity_name[:-1]
-				elif entity_name.endswith("es"):
-					entity_name = entity_name[:-2]
-				elif entity_name.endswith("s"):
-					entity_name = entity_name[:-1]
-			count = interface.get_fridge().count_entity(entity_name)
-			if count == 0:
+			entity_name = name_table.resolve(entity_name, amount)
+			fridge = interface.get_fridge()
+			with command_metrics.phase("mutate"):
+				result = fridge.move_many(entity_name, amount, get_mini_fridge(user))
+			if result == MoveResult.missing:
 				await interface.print("No such _" + entity_name + "_ is in the fridge!")
-			elif amount > count:
-				await interface.print("There are only **" + str(count) + "** of **" + entity_name + "** in the fridge!")
-			elif get_mini_fridge(str(user)).is_full():
+			elif result == MoveResult.too_few:
+				await interface.print("There are only **" + str(fridge.count_entity(entity_name)) + "** of **" + entity_name + "** in the fridge!")
+			elif result == MoveResult.full:
 				await interface.print(user.name + "'s minifridge is full and won't handle anymore things stuffed into it!")
-			elif get_mini_fridge(str(user)).remaining_space() < amount:
+			elif result == MoveResult.too_full:
 				await interface.print(user.name + "'s minifridge is too full to handle that many more things stuffed inside of it!")
+			elif result == MoveResult.glued:
+				await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
 			else:
-				for i in range(amount):
-					entity = interface.get_fridge().get_entity(entity_name)
-					if not entity.movable:
-						await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
-						return
-					entity.put(get_mini_fridge(str(user)))
+				await save_world()
 				if amount == 1:
 					determiner_word = "The"
 				else:
 					determiner_word = str(amount) + " of"
 				await interface.print(determiner_word + " " + entity_name + " was taken from the fridge and put in " + user.name + "'s minifridge.")
 				await invoke_command(interface, user, "look")
-				save_world()
 
 class DespawnCommand(Command):
 	def __init__(self):
@@ -666,28 +2883,24 @@ class DespawnCommand(Command):
 		else:
 			amount = 1
 		entity_name = " ".join(args)
-		if amount <= 0:
+		if entity_name == "": # just an amount
+			await self.print_usage(interface)
+		elif amount <= 0:
 			await interface.print("Nothing happened.")
 		else:
-			if amount != 1:
-				if entity_name.endswith("ies"):
-					entity_name = entity_name[:-3] + "y"
-				elif entity_name.endswith("les"):
-					entity_name = entity_name[:-1]
-				elif entity_name.endswith("es"):
-					entity_name = entity_name[:-2]
-				elif entity_name.endswith("s"):
-					entity_name = entity_name[:-1]
-			count = interface.get_fridge().count_entity(entity_name)
-			if count == 0:
+			entity_name = name_table.resolve(entity_name, amount)
+			fridge = interface.get_fridge()
+			with command_metrics.phase("mutate"):
+				result = fridge.move_many(entity_name, amount, None)
+			if result == MoveResult.missing:
 				await interface.print("No such _" + entity_name + "_ is in the fridge!")
-			elif amount > count:
-				await interface.print("There are only **" + str(count) + "** of **" + entity_name + "** in the fridge!")
+			elif result == MoveResult.too_few:
+				await interface.print("There are only **" + str(fridge.count_entity(entity_name)) + "** of **" + entity_name + "** in the fridge!")
+			elif result == MoveResult.glued:
+				await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
 			else:
-				for i in range(amount):
-					interface.get_fridge().get_entity(entity_name).take()
+				await save_world()
 				await invoke_command(interface, user, "look")
-				save_world()
 
 class SpawnCommand(Command):
 	def __init__(self):
@@ -699,29 +2912,27 @@ class SpawnCommand(Command):
 		else:
 			amount = 1
 		entity_name = " ".join(args)
-		if amount <= 0:
+		if entity_name == "": # just an amount
+			await self.print_usage(interface)
+		elif amount <= 0:
 			await interface.print("Nothing happened.")
 		else:
-			if amount != 1:
-				if entity_name.endswith("ies"):
-					entity_name = entity_name[:-3] + "y"
-				elif entity_name.endswith("les"):
-					entity_name = entity_name[:-1]
-				elif entity_name.endswith("es"):
-					entity_name = entity_name[:-2]
-				elif entity_name.endswith("s"):
-					entity_name = entity_name[:-1]
+			entity_name = name_table.resolve(entity_name, amount)
 			if interface.get_fridge().is_full():
 				await interface.print("The fridge is full and won't handle anymore things stuffed into it!")
 			elif interface.get_fridge().remaining_space() < amount:
 				await interface.print("The fridge is too full to handle that many more things stuffed inside of it!")
 			else:
-				for i in range(amount):
+				spawned = 0
+				while spawned < amount:
 					entity = create_thing(entity_name)
 					entity.creator = str(user)
+					if entity.is_stackable():
+						entity.quantity = amount - spawned
+					spawned += entity.quantity
 					entity.put(interface.get_fridge())
+				await save_world()
 				await invoke_command(interface, user, "look")
-				save_world()
 
 class InteractCommand(Command):
 	def __init__(self):
@@ -739,8 +2950,13 @@ class InteractCommand(Command):
 		if entity == None:
 			await interface.print("No _" + entity_name + "_ is in the fridge.")
 		else:
-			await entity.interact(interface, user, arg)
-			save_world()
+			with command_metrics.phase("mutate"):
+				if entity.quantity > 1:
+					# only one of the stack gets used
+					entity = interface.get_fridge().put_into(entity.split(1), False)
+				await entity.interact(interface, user, arg)
+				record_mutation(entity)
+			await save_world()
 
 class PokeCommand(Command):
 	def __init__(self):
@@ -798,13 +3014,19 @@ class CheckCommand(Command):
 		if entity == None:
 			await interface.print("No _" + entity_name + "_ is in the fridge.")
 		else:
-			content_string = ", ".join(["**" + i.entity_name + "**" for i in entity.contents])
+			content_names = []
+			for i in entity.contents:
+				if i.quantity > 1:
+					content_names.append("**" + str(i.quantity) + " " + name_table.get(i.entity_name).plural + "**")
+				else:
+					content_names.append("**" + i.entity_name + "**")
+			content_string = ", ".join(content_names)
 			check_string = entity.check(user) + "\n"
-			if len(entity.contents) == 0:
+			if entity.item_count == 0:
 				check_string += "It doesn't look like there is anything stuffed inside of the " + entity.entity_name + "."
-			elif len(entity.contents) < 2:
+			elif entity.item_count < 2:
 				check_string += "It looks like there might be something stuffed into the " + entity.entity_name + ": " + content_string
-			elif len(entity.contents) < 5:
+			elif entity.item_count < 5:
 				check_string += "It looks like some things might have been stuffed into the " + entity.entity_name + ": " + content_string
 			else:
 				check_string += "It looks like the " + entity.entity_name + " is full of things stuffed into it: " + content_string
@@ -828,46 +3050,43 @@ class StuffCommand(Command):
 			entity_name, target = entity_name.split(",", 1)
 			entity_name = entity_name.strip()
 			target = target.strip()
-			if amount != 1:
-				if entity_name.endswith("ies"):
-					entity_name = entity_name[:-3] + "y"
-				elif entity_name.endswith("les"):
-					entity_name = entity_name[:-1]
-				elif entity_name.endswith("es"):
-					entity_name = entity_name[:-2]
-				elif entity_name.endswith("s"):
-					entity_name = entity_name[:-1]
-			count = get_mini_fridge(str(user)).count_entity(entity_name)
-			if count == 0:
+			entity_name = name_table.resolve(entity_name, amount)
+			mini_fridge = get_mini_fridge(user)
+			fridge = interface.get_fridge()
+			target_entity = fridge.get_entity(target)
+			if mini_fridge.count_entity(entity_name) == 0:
 				await interface.print("No such _" + entity_name + "_ is in " + user.name + "'s minifridge!")
-			elif amount > count:
-				await interface.print("There are only **" + str(count) + "** of **" + entity_name + "** in " + user.name + "'s minifridge!")
+			elif target_entity == None:
+				await interface.print("No such _" + target + "_ is in the fridge!")
+			elif target_entity.max_contents == 0:
+				await interface.print("Things can't be stuffed into the " + target_entity.entity_name + "!")
 			else:
-				fridge = interface.get_fridge()
-				target_entity = fridge.get_entity(target)
-				if target_entity == None:
-					await interface.print("No such _" + target + "_ is in the fridge!")
-				elif target_entity.max_contents == 0:
-					await interface.print("Things can't be stuffed into the " + target_entity.entity_name + "!")
-				elif target_entity.is_full():
+				# one of a stack is just like the rest of it, so the stack can be checked before any of it is split off
+				with command_metrics.phase("mutate"):
+					result = mini_fridge.plan_move(entity_name, amount, target_entity)[0]
+					if result == MoveResult.moved:
+						if target_entity.quantity > 1:
+							# things only get stuffed into one of the stack
+							target_entity = fridge.put_into(target_entity.split(1), False)
+						result = mini_fridge.move_many(entity_name, amount, target_entity)
+				if result == MoveResult.too_few:
+					await interface.print("There are only **" + str(mini_fridge.count_entity(entity_name)) + "** of **" + entity_name + "** in " + user.name + "'s minifridge!")
+				elif result == MoveResult.full:
 					await interface.print("The " + target_entity.entity_name + " is full and won't handle anymore things stuffed into it!")
+				elif result == MoveResult.too_full:
+					await interface.print("The " + target_entity.entity_name + " is too full to handle that many more things stuffed inside of it!")
+				elif result == MoveResult.into_itself:
+					await interface.print("The " + target_entity.entity_name + " can't be stuffed inside of itself.")
+				elif result == MoveResult.glued:
+					await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
 				else:
-					for i in range(amount):
-						entity = get_mini_fridge(str(user)).get_entity(entity_name)
-						if entity == target_entity:
-							await interface.print("The " + entity.entity_name + " can't be stuffed inside of itself.")
-							return
-						elif not entity.movable:
-							await interface.print("The " + entity_name + " is glued inside of the fridge and won't move.")
-							return
-						entity.put(target_entity)
+					await save_world()
 					if amount == 1:
 						determiner_word = "The"
 					else:
 						determiner_word = str(amount) + " of"
 					await interface.print(determiner_word + " " + entity_name + " was taken from " + user.name + "'s minifridge and put in the " + target_entity.entity_name + ".")
 					await invoke_command(interface, user, "look")
-					save_world()
 
 class UnstuffCommand(Command):
 	def __init__(self):
@@ -887,40 +3106,38 @@ class UnstuffCommand(Command):
 			entity_name, target = entity_name.split(",", 1)
 			entity_name = entity_name.strip()
 			target = target.strip()
-			if amount != 1:
-				if entity_name.endswith("ies"):
-					entity_name = entity_name[:-3] + "y"
-				elif entity_name.endswith("les"):
-					entity_name = entity_name[:-1]
-				elif entity_name.endswith("es"):
-					entity_name = entity_name[:-2]
-				elif entity_name.endswith("s"):
-					entity_name = entity_name[:-1]
+			entity_name = name_table.resolve(entity_name, amount)
 			fridge = interface.get_fridge()
 			target_entity = fridge.get_entity(target)
 			if target_entity == None:
 				await interface.print("No such _" + target + "_ is in the fridge!")
 			else:
-				count = target_entity.count_entity(entity_name)
-				if count == 0:
+				with command_metrics.phase("mutate"):
+					result = target_entity.move_many(entity_name, amount, get_mini_fridge(user))
+				if result == MoveResult.missing:
 					await interface.print("No such _" + entity_name + "_ is in the " + target_entity.entity_name + "!")
-				elif amount > count:
-					await interface.print("There are only **" + str(count) + "** of **" + entity_name + "** in the " + target_entity.entity_name + "!")
+				elif result == MoveResult.too_few:
+					await interface.print("There are only **" + str(target_entity.count_entity(entity_name)) + "** of **" + entity_name + "** in the " + target_entity.entity_name + "!")
+				elif result == MoveResult.full:
+					await interface.print(user.name + "'s minifridge is full and won't handle anymore things stuffed into it!")
+				elif result == MoveResult.too_full:
+					await interface.print(user.name + "'s minifridge is too full to handle that many more things stuffed inside of it!")
+				elif result == MoveResult.into_itself:
+					await interface.print("The " + target_entity.entity_name + " can't be stuffed inside of itself.")
+				elif result == MoveResult.glued:
+					await interface.print("The " + entity_name + " is glued inside of the " + target_entity.entity_name + " and won't move.")
 				else:
-					for i in range(amount):
-						entity = target_entity.get_entity(entity_name)
-						entity.put(get_mini_fridge(str(user)))
+					await save_world()
 					if amount == 1:
 						determiner_word = "The"
 					else:
 						determiner_word = str(amount) + " of"
 					await interface.print(determiner_word + " " + entity_name + " was taken from the " + target_entity.entity_name + " and put in " + user.name + "'s minifridge.")
 					await invoke_command(interface, user, "look")
-					save_world()
 
 class InfoCommand(Command):
 	def __init__(self):
-		super().__init__(["info", "information", "stats"], "Examine a thing in the fridge.", CommandClass.fridge, "The info command prints known information about a thing in the fridge of the channel used to invoke the command, including its name, its current whereabouts, the name of the user who created it, its age, the name of the last user to interact with it, and, if applicable, how long ago that happened.", "[thing name]", 1)
+		super().__init__(["info", "information"], "Examine a thing in the fridge.", CommandClass.fridge, "The info command prints known information about a thing in the fridge of the channel used to invoke the command, including its name, its current whereabouts, the name of the user who created it, its age, the name of the last user to interact with it, and, if applicable, how long ago that happened.", "[thing name]", 1)
 
 	async def action(self, interface, user, args=[]):
 		entity_name = " ".join(args)
@@ -930,6 +3147,80 @@ class InfoCommand(Command):
 		else:
 			await entity.about(interface, user, args[1:])
 
+# the keys of the fridges someone can find things in from a channel
+# which are their own minifridge and the fridges of the channels they can read in the same server
+def get_visible_fridge_keys(channel, user):
+	keys = [("user", user.id)]
+	if channel.is_private or channel.server == None:
+		return keys
+	for other in channel.server.channels:
+		if other.permissions_for(user).read_messages:
+			keys.append(("channel", other.id))
+	return keys
+
+class FindCommand(Command):
+	def __init__(self):
+		super().__init__(["find", "where", "locate", "search"], "Find out which fridge a thing is in.", CommandClass.fridge, "The find command looks for things by name in every fridge you can see, which is your _personal minifridge_ and the fridges of the channels you can read in the server the command is invoked from, including inside of bags and other things.  If nothing has exactly that name, the things with the closest names turn up instead, so typos are okay.  Admins can find things in every fridge.", "[thing name]", 1)
+
+	async def action(self, interface, user, args=[]):
+		entity_name = " ".join(args)
+		if CommandClass.admin in interface.get_permissions():
+			owners = None
+		else:
+			owners = get_visible_fridge_keys(interface.channel, user)
+		with command_metrics.phase("render"):
+			# things with the same name in the same place are counted together
+			places = collections.OrderedDict() # (name, container) -> how many
+			for key in name_index.search(entity_name, find_results_shown, owners):
+				for entity in name_index.get_entities(key, owners):
+					if entity.fridge_key == None: # fridges themselves aren't things
+						place = (entity.entity_name, entity.parent)
+						places[place] = places.get(place, 0) + entity.quantity
+			lines = []
+			for (name, container), count in itertools.islice(places.items(), find_results_shown):
+				path = []
+				while container != None:
+					if container.fridge_key == ("user", user.id):
+						path.append("your minifridge")
+					else:
+						path.append("**" + container.get_display_name() + "**")
+					if container.fridge_key != None:
+						break
+					container = container.parent
+				if count == 1:
+					lines.append("**" + name + "** is in " + " in ".join(path) + ".")
+				else:
+					lines.append("**" + str(count) + " " + name_table.get(name).plural + "** are in " + " in ".join(path) + ".")
+		if len(lines) == 0:
+			await interface.print("Nothing like _" + entity_name + "_ is in any fridge you can see.")
+		else:
+			if len(places) > len(lines):
+				lines.append("_And in " + str(len(places) - len(lines)) + " more places..._")
+			await interface.print("\n".join(lines))
+
+class StatsCommand(Command):
+	def __init__(self):
+		super().__init__(["stats", "metrics"], "See how Fridge Bot is holding up.", CommandClass.admin, "The stats command lists every command that has been invoked since Fridge Bot started, slowest in total first, with how many times it ran, how many times it failed, how long it took on average, how long 99% of runs took at most, and how much of that time went to rendering listings, changing things in Fridgeverse, printing, and saving Fridgeverse.  After that come the fridge locks, saving, sending messages, the look cache, and logging.")
+
+	async def action(self, interface, user, args=[]):
+		lines = []
+		for name, metrics in sorted(command_metrics.commands.items(), key=lambda x: -x[1]["seconds"]):
+			seconds = metrics["seconds"]
+			line = "**" + name + "**: " + str(metrics["count"]) + " runs, " + str(metrics["errors"]) + " errors, %.2f ms on average, 99%% within %g ms" % (1000 * seconds / metrics["count"], 1000 * command_metrics.get_percentile(metrics, 0.99))
+			if seconds > 0:
+				line += ", " + ", ".join("%d%% %s" % (100 * metrics["phases"][phase] / seconds, phase) for phase in command_metrics.phases)
+			lines.append(line)
+		if len(lines) == 0:
+			lines.append("No commands have been invoked yet.")
+		lines.append("")
+		lines.append("_Fridge locks_: %d taken, %d had to wait, %.2f ms longest wait" % (fridge_locks.acquisitions, fridge_locks.contended, 1000 * fridge_locks.max_wait))
+		lines.append("_Saving_: %d waiting, %d journal writes, %d failed, %d snapshots, %d failed" % (persistence.queue_depth(), persistence.journal_writes, persistence.failed_writes, persistence.saves, persistence.failed_saves))
+		if outbound.sent > 0:
+			lines.append("_Sending_: %d waiting, %d sent, %d failed, %.2f ms average wait" % (outbound.queue_depth(), outbound.sent, outbound.failed, 1000 * outbound.total_latency / outbound.sent))
+		lines.append("_Look cache_: %d hits, %d misses" % (look_cache_stats["hits"], look_cache_stats["misses"]))
+		lines.append("_Logging_: %d waiting, %d written, %d dropped" % (message_logger.queue_depth(), message_logger.written, message_logger.dropped))
+		await interface.print("\n".join(lines))
+
 class AboutCommand(Command):
 	def __init__(self):
 		super().__init__(["about", "credit", "credits", "fridge", "fridgebot", "creator", "author", "programmer"], "Learn about Fridge Bot!", CommandClass.common, "The about command prints a detailed introduction to Fridge Bot.  Or if you pass an argument, it can also be used an an alias for the _info_ command.", "{thing name}")
@@ -966,8 +3257,9 @@ class GrantCommand(Command):
 					permissions[user_tag][1].remove(command_class)
 				else:
 					permissions[user_tag][0].append(command_class)
+				invalidate_permissions(user_tag)
 				await invoke_command(interface, user, "permissions", [user_tag])
-				save_permissions()
+				await save_permissions_later()
 
 class RevokeCommand(Command):
 	def __init__(self):
@@ -988,8 +3280,9 @@ class RevokeCommand(Command):
 					permissions[user_tag][1].append(command_class)
 				else:
 					permissions[user_tag][0].remove(command_class)
+				invalidate_permissions(user_tag)
 				await invoke_command(interface, user, "permissions", [user_tag])
-				save_permissions()
+				await save_permissions_later()
 
 class PermissionsCommand(Command):
 	def __init__(self):
@@ -1015,7 +3308,7 @@ class PermissionsCommand(Command):
 				class_word = "class"
 			else:
 				class_word = "classes"
-			final_string = ", ".join(["**" + cc.name + "**" for cc in final_permissions])
+			final_string = ", ".join(["**" + cc.name + "**" for cc in sorted(final_permissions, key=lambda cc: cc.value)])
 			string = "**" + user_tag + "** is allowed to use commands of " + class_word + " " + final_string + ", "
 		if len(granted_permissions) == 0:
 			string += "has _not been granted any privileges_, "
@@ -1037,25 +3330,87 @@ class PermissionsCommand(Command):
 			string += "has lost " + privilege_word + " " + lost_string + "." 
 		await interface.print(string)
 
-# global dictionary of commands
-commands = {}
-
-def get_unique_commands():
-	unique_commands = []
-	for command in commands.values():
-		if not command in unique_commands:
-			unique_commands.append(command)
-	return unique_commands
+# every command Fridge Bot knows and everything about them that can be worked out ahead of time
+# built the first time it's needed and built again after a command is added
+class CommandRegistry():
+	def __init__(self):
+		self.added = []
+		self.built = False
+
+	def add(self, command):
+		self.added.append(command)
+		self.built = False
+
+	def build(self):
+		aliases = {}
+		for command in self.added:
+			for alias in command.aliases:
+				aliases[alias.lower()] = command
+		self.aliases = types.MappingProxyType(aliases) # alias -> command
+		self.sorted_aliases = sorted(aliases)
+		# a command whose aliases were all taken by later commands isn't listed
+		self.unique = tuple(sorted(dict.fromkeys(aliases.values()), key=lambda x: (x.command_class.value, x.aliases[0])))
+		self.strings = {command: (command.get_description_string(), command.get_usage_string(), command.get_help_string()) for command in self.unique}
+		self.listings = {} # command classes -> listing of the commands they can invoke
+		self.full_listing = "\n".join(self.strings[command][0] for command in self.unique)
+		self.built = True
+
+	def ensure_built(self):
+		if not self.built:
+			self.build()
+
+	# find the command with an alias, or with an alias starting with it if command_prefixes is on
+	# returns None if there isn't exactly one such command
+	def resolve(self, alias):
+		self.ensure_built()
+		alias = alias.lower()
+		command = self.aliases.get(alias)
+		if command != None or not command_prefixes:
+			return command
+		i = bisect.bisect_left(self.sorted_aliases, alias)
+		while i < len(self.sorted_aliases) and self.sorted_aliases[i].startswith(alias):
+			if command == None:
+				command = self.aliases[self.sorted_aliases[i]]
+			elif self.aliases[self.sorted_aliases[i]] is not command:
+				return None
+			i += 1
+		return command
+
+	def get_unique_commands(self):
+		self.ensure_built()
+		return self.unique
+
+	# (description, usage, help) strings of a command
+	def get_strings(self, command):
+		self.ensure_built()
+		strings = self.strings.get(command)
+		if strings == None:
+			strings = (command.get_description_string(), command.get_usage_string(), command.get_help_string())
+		return strings
+
+	# the listing of the commands that can be invoked with some permissions, or of all of them
+	def get_listing(self, permissions=None):
+		self.ensure_built()
+		if permissions == None:
+			return self.full_listing
+		key = frozenset(permissions)
+		listing = self.listings.get(key)
+		if listing == None:
+			listing = "\n".join(self.strings[command][0] for command in self.unique if command.command_class in key)
+			self.listings[key] = listing
+		return listing
+
+command_registry = CommandRegistry()
 
 def add_command(command):
-	for alias in command.aliases:
-		commands[alias.lower()] = command
+	command_registry.add(command)
 
 async def invoke_command(interface, user, command, args=[]):
-	if not command.lower() in commands:
+	found = command_registry.resolve(command)
+	if found == None:
 		await interface.print("Fridge Bot doesn't know _" + command + "_, silly!")
 	else:
-		await commands[command.lower()].invoke(interface, user, args)
+		await found.invoke(interface, user, args)
 
 # creating and registering command singletons
 add_command(TestCommand())
@@ -1072,6 +3427,8 @@ add_command(TakeCommand())
 add_command(StoreCommand())
 add_command(InteractCommand())
 add_command(InfoCommand())
+add_command(FindCommand())
+add_command(StatsCommand())
 add_command(AboutCommand())
 add_command(IntroCommand())
 add_command(PermissionsCommand())
@@ -1086,21 +3443,101 @@ add_command(EatCommand())
 add_command(ReadCommand())
 add_command(WriteCommand())
 
+# commands hold the locks of all the fridges they might touch until they're done
+# so commands for the same fridge take turns, and commands for different fridges don't wait on each other
+class FridgeLocks():
+	def __init__(self):
+		self.locks = {} # key -> [lock, commands holding or waiting for it]
+		self.acquisitions = 0
+		self.contended = 0 # acquisitions that had to wait for another command
+		self.total_wait = 0.0
+		self.max_wait = 0.0
+
+	# locks are always taken in sorted order so two commands can't end up waiting on each other
+	async def acquire(self, keys):
+		start = time.perf_counter()
+		for key in keys:
+			if key not in self.locks:
+				self.locks[key] = [asyncio.Lock(), 0]
+			self.locks[key][1] += 1
+		held = []
+		contended = False
+		try:
+			for key in keys:
+				lock = self.locks[key][0]
+				if lock.locked():
+					contended = True
+				await lock.acquire()
+				held.append(key)
+		except BaseException:
+			for key in held:
+				self.locks[key][0].release()
+			self.forget(keys)
+			raise
+		wait = time.perf_counter() - start
+		self.acquisitions += 1
+		if contended:
+			self.contended += 1
+		self.total_wait += wait
+		self.max_wait = max(self.max_wait, wait)
+
+	def release(self, keys):
+		for key in keys:
+			self.locks[key][0].release()
+		self.forget(keys)
+
+	# locks nobody is using are thrown away so there isn't one kept around for every channel ever seen
+	def forget(self, keys):
+		for key in keys:
+			self.locks[key][1] -= 1
+			if self.locks[key][1] == 0:
+				del self.locks[key]
+
+fridge_locks = FridgeLocks()
+
 # remove the trigger from the string first
 async def parse_command(interface, user, command_string):
 	words = command_string.split()
 	if len(words) == 0:
 		await interface.print("Error parsing command!")
+		await interface.flush()
 	else:
-		await invoke_command(interface, user, words[0], words[1:])
+		keys = sorted(set(interface.get_fridge_keys()))
+		await fridge_locks.acquire(keys)
+		interface.locked_keys = keys
+		try:
+			await invoke_command(interface, user, words[0], words[1:])
+		finally:
+			try:
+				# commands that only look around still make fridges for new users and channels, and those need saving too
+				await save_world()
+			finally:
+				await interface.flush()
+				fridge_locks.release(interface.locked_keys)
+				interface.locked_keys = []
 
 ### Interface Stuff ###
 
 class Interface():
+	locked_keys = [] # the fridge locks the command using this interface is holding
+
 	# virtual method
 	def read(self):
 		return None
 
+	# wait for something, like a reply, while letting other commands use the fridges of this command
+	# anything the command found out about those fridges before waiting has to be checked again afterwards
+	async def without_locks(self, awaitable):
+		keys = self.locked_keys
+		self.locked_keys = []
+		fridge_locks.release(keys)
+		try:
+			with command_metrics.phase(None):
+				return await awaitable
+		finally:
+			await fridge_locks.acquire(keys)
+			self.locked_keys = keys
+
 	# virtual method
 	def print(self, message):
 		pass
@@ -1110,65 +3547,361 @@ class Interface():
 	def get_fridge(self):
 		return None
 
+	# send everything printed so far
+	# virtual method
+	async def flush(self):
+		pass
+
+	# keys of the fridges commands from this interface might touch
+	# virtual method
+	def get_fridge_keys(self):
+		return []
+
 	# get permissions
 	def get_permissions(self):
 		return standard_permissions
 
+# stands in for the discord user, channel, or server whose fridge the console is working on
+class ConsoleTarget():
+	def __init__(self, id, name, server=None, is_private=False):
+		self.id = id
+		self.name = name
+		self.server = server
+		self.is_private = is_private
+
+	def __str__(self):
+		return self.name
+
+console_user = ConsoleTarget("console", "Console")
+console_channel = ConsoleTarget("console", "console")
+
 class ConsoleInterface(Interface):
+	def __init__(self, reader=None, quiet=False):
+		super().__init__()
+		self.reader = reader # None when there's nobody to reply
+		self.quiet = quiet
+		self.channel = console_channel # a private channel means a user's minifridge
+
 	def get_permissions(self):
-		return [CommandClass.common, CommandClass.admin]
+		return console_permissions
 
-	def read(self):
-		return input()
+	async def read(self, content=None, check=None):
+		if self.reader == None:
+			return None
+		return await self.without_locks(self.reader.read_line())
 
-	def print(self, message):
-		print("[CONSOLE] " + message)
+	async def print(self, message):
+		with command_metrics.phase("print"):
+			if not self.quiet:
+				print("[CONSOLE] " + message)
 
 	def get_fridge(self):
-		return root_entity.get_entity_implicit("Console Fridge")
+		if self.channel is console_channel:
+			return root_entity.get_entity_implicit("Console Fridge")
+		elif self.channel.is_private:
+			return get_mini_fridge(self.channel)
+		else:
+			return get_channel_fridge(self.channel)
+
+	def get_fridge_keys(self):
+		if self.channel is console_channel:
+			return [("console", ""), ("user", console_user.id)]
+		elif self.channel.is_private:
+			return [("user", self.channel.id)]
+		else:
+			return [("channel", self.channel.id), ("user", console_user.id)]
+
+# commands waiting for a user to reply in a channel, by (user id, channel id)
+# replies are handed over from on_message instead of being treated as commands
+class PendingReplies():
+	def __init__(self):
+		self.waiting = {} # (user id, channel id) -> (future, content, check)
+		self.replies = 0
+		self.timeouts = 0
+
+	# returns the reply message, or None if there wasn't one in time
+	async def wait(self, user, channel, content=None, check=None, timeout=reply_timeout):
+		key = (user.id, channel.id)
+		previous = self.waiting.get(key)
+		if previous != None:
+			previous[0].cancel()
+		future = asyncio.get_event_loop().create_future()
+		self.waiting[key] = (future, content, check)
+		try:
+			return await asyncio.wait_for(future, timeout)
+		except asyncio.TimeoutError:
+			self.timeouts += 1
+			return None
+		finally:
+			if self.waiting.get(key, (None,))[0] is future:
+				del self.waiting[key]
+
+	# returns whether the message was a reply a command was waiting for
+	def deliver(self, message):
+		key = (message.author.id, message.channel.id)
+		waiting = self.waiting.get(key)
+		if waiting == None:
+			return False
+		future, content, check = waiting
+		if future.done() or (content != None and message.content != content) or (check != None and not check(message)):
+			return False
+		del self.waiting[key]
+		future.set_result(message)
+		self.replies += 1
+		return True
+
+pending_replies = PendingReplies()
 
 class DiscordChannelInterface(Interface):
 	def __init__(self, channel, user):
 		super().__init__()
 		self.channel = channel
 		self.user = user
+		self.messages = [] # printed but not sent yet, packed into as few discord messages as they fit in
 
 	async def read(self, content=None, check=None):
-		response = await client.wait_for_message(author=self.user, channel=self.channel, content=content, check=check)
-		ignore_messages.append(response)
+		await self.flush()
+		response = await self.without_locks(pending_replies.wait(self.user, self.channel, content, check))
+		if response == None:
+			return None
 		return response.content
 
+	# prints are held until the command is done, or until it waits for a reply,
+	# and then sent together in as few messages as they fit in
+	# they're split and packed as they're printed, so that's the work timed as printing
 	async def print(self, message):
-		if len(message) > max_message_length:
-			first = message
-			rest = ""
-			while len(first) > max_message_length:
-				first, last = first.rsplit("\n", 1)
-				rest = "\n" + last + rest
-			await client.send_message(self.channel, first)
-			await self.print(rest[1:])
-		else:
-			await client.send_message(self.channel, message)
+		with command_metrics.phase("print"):
+			messages = self.messages
+			for piece in split_message(message):
+				if len(messages) > 0 and len(messages[-1]) + 1 + len(piece) <= max_message_length:
+					messages[-1] += "\n" + piece
+				else:
+					messages.append(piece)
+
+	async def flush(self):
+		messages = self.messages
+		self.messages = []
+		for message in messages:
+			outbound.send(self.channel, message)
 
 	def get_fridge(self):
 		if self.channel.is_private:
-			return get_mini_fridge(str(self.user))
+			return get_mini_fridge(self.user)
+		else:
+			return get_channel_fridge(self.channel)
+
+	# the local fridge and the user's minifridge
+	def get_fridge_keys(self):
+		if self.channel.is_private:
+			return [("user", self.user.id)]
 		else:
-			return get_channel_fridge(str(self.channel.server), str(self.channel))
+			return [("channel", self.channel.id), ("user", self.user.id)]
 
 	def get_permissions(self):
 		return get_permissions(self.user)
 
-# interface singletons
-console_interface = ConsoleInterface()
+markdown_pattern = re.compile(r"\*\*|_")
+
+# split a message into pieces that fit in a discord message
+# at line breaks where possible, then between words, and then anywhere
+# bold and italics left open at the end of a piece are closed there and opened again at the start of the next
+def split_message(message):
+	start = 0
+	reopen = "" # markdown still open from the last piece
+	markers = [] # open markdown, innermost last
+	while len(reopen) + len(message) - start > max_message_length:
+		# leave room for the longest closing markdown
+		end = start + max_message_length - len(reopen) - 3
+		cut = message.rfind("\n", start, end)
+		if cut > start:
+			resume = cut + 1
+		else:
+			cut = message.rfind(" ", start, end)
+			if cut > start:
+				resume = cut + 1
+			else:
+				cut = end
+				if message[cut - 1] == "*" and message[cut] == "*":
+					cut -= 1 # don't split up a **
+				resume = cut
+		piece = message[start:cut]
+		for match in markdown_pattern.finditer(piece):
+			marker = match.group()
+			if marker in markers:
+				markers.remove(marker)
+			else:
+				markers.append(marker)
+		yield reopen + piece + "".join(reversed(markers))
+		reopen = "".join(markers)
+		start = resume
+	yield reopen + message[start:]
+
+# messages waiting to be sent to one channel, sent in order
+# no faster than channel_rate_limit messages every channel_rate_period seconds
+class ChannelQueue():
+	def __init__(self, outbound, channel):
+		self.outbound = outbound
+		self.channel = channel
+		self.messages = collections.deque() # (message, time it was queued)
+		self.tokens = channel_rate_limit
+		self.refilled = time.monotonic()
+		self.task = None
+
+	def refill(self):
+		now = time.monotonic()
+		self.tokens = min(channel_rate_limit, self.tokens + (now - self.refilled) * channel_rate_limit / channel_rate_period)
+		self.refilled = now
+
+	def send(self, message):
+		self.messages.append((message, time.perf_counter()))
+		if self.task == None:
+			self.task = asyncio.ensure_future(self.send_messages())
+
+	async def send_messages(self):
+		try:
+			while len(self.messages) > 0:
+				self.refill()
+				if self.tokens < 1:
+					await asyncio.sleep((1 - self.tokens) * channel_rate_period / channel_rate_limit)
+					continue
+				self.tokens -= 1
+				message, queued = self.messages.popleft()
+				try:
+					await client.send_message(self.channel, message)
+				except Exception as e:
+					self.outbound.failed += 1
+					print("Failed to send a message to " + str(self.channel) + ": " + str(e))
+				else:
+					self.outbound.record_sent(time.perf_counter() - queued)
+		finally:
+			self.task = None
+			self.outbound.drained(self)
+
+# every message the bot sends goes through here, with a queue for each channel
+class OutboundQueue():
+	def __init__(self):
+		self.channels = {} # channel id -> ChannelQueue
+		self.sent = 0
+		self.failed = 0
+		self.total_latency = 0.0 # from being queued to being sent
+		self.max_latency = 0.0
+
+	def send(self, channel, message):
+		queue = self.channels.get(channel.id)
+		if queue == None:
+			queue = ChannelQueue(self, channel)
+			self.channels[channel.id] = queue
+		queue.send(message)
+
+	def queue_depth(self):
+		return sum(len(queue.messages) for queue in self.channels.values())
+
+	def record_sent(self, latency):
+		self.sent += 1
+		self.total_latency += latency
+		self.max_latency = max(self.max_latency, latency)
+
+	# a queue is only forgotten once it's empty and its rate limit has recovered
+	def drained(self, queue):
+		if queue.task != None or len(queue.messages) > 0 or self.channels.get(queue.channel.id) is not queue:
+			return
+		queue.refill()
+		if queue.tokens >= channel_rate_limit:
+			del self.channels[queue.channel.id]
+		else:
+			wait = (channel_rate_limit - queue.tokens) * channel_rate_period / channel_rate_limit
+			asyncio.get_event_loop().call_later(wait, self.drained, queue)
+
+outbound = OutboundQueue()
 
 ### Console Interface ###
 
-# ok honestly, i have _no clue_ how coroutines work, so i dunno how to make this work
+# reads lines from stdin on a thread of its own so the event loop never waits on the terminal
+class ConsoleReader():
+	def __init__(self):
+		self.lines = None
+
+	def start(self):
+		loop = asyncio.get_event_loop()
+		self.lines = asyncio.Queue()
+		threading.Thread(target=self.run, args=(loop,), name="console", daemon=True).start()
+
+	def run(self, loop):
+		while True:
+			line = sys.stdin.readline()
+			if line == "":
+				loop.call_soon_threadsafe(self.lines.put_nowait, None)
+				break
+			loop.call_soon_threadsafe(self.lines.put_nowait, line.rstrip("\n"))
+
+	# returns None once stdin is closed
+	async def read_line(self):
+		return await self.lines.get()
+
+# the name of the fridge with a key, or else a name to make it with
+def get_fridge_name(key, default):
+	entity = fridge_registry.get(key)
+	if entity == None and database != None:
+		entity = database.load_fridge("fridge_key = ?", (fridge_key_string(key),))
+	if entity == None:
+		return default
+	return entity.entity_name
+
+# besides commands, the console understands directives for choosing which fridge commands happen in:
+# @fridge console, @fridge user [user id] {name}, and @fridge channel [server id] [channel id] {name}
+# names are only needed when the fridge doesn't exist yet, otherwise the ones it has are kept
+async def run_console_line(interface, line):
+	if not line.startswith("@"):
+		await parse_command(interface, console_user, line)
+		return
+	words = line[1:].split()
+	if len(words) >= 2 and words[0] == "fridge" and words[1] == "console":
+		interface.channel = console_channel
+	elif len(words) >= 3 and words[0] == "fridge" and words[1] == "user":
+		name = " ".join(words[3:]) or get_fridge_name(("user", words[2]), words[2])
+		interface.channel = ConsoleTarget(words[2], name, is_private=True)
+	elif len(words) >= 4 and words[0] == "fridge" and words[1] == "channel":
+		server = ConsoleTarget(words[2], get_fridge_name(("server", words[2]), words[2]))
+		name = " ".join(words[4:]) or get_fridge_name(("channel", words[3]), words[3])
+		interface.channel = ConsoleTarget(words[3], name, server)
+	else:
+		await interface.print("Fridge Bot doesn't understand the directive _" + line + "_.")
 
-def console_interface_loop():
+async def console_interface_loop():
+	reader = ConsoleReader()
+	reader.start()
+	interface = ConsoleInterface(reader)
 	while not client.is_closed:
-		parse_command(console_interface, None, input("> "))
+		print("> ", end="", flush=True)
+		line = await reader.read_line()
+		if line == None:
+			break
+		if line.strip() != "":
+			await run_console_line(interface, line.strip())
+
+# run every line of a file on the console as fast as they'll go, then say how it went
+# blank lines and lines starting with # are skipped
+async def run_batch(batch_file, quiet=False):
+	interface = ConsoleInterface(None, quiet)
+	latencies = []
+	errors = 0
+	start = time.perf_counter()
+	with open(batch_file, "r", encoding='UTF-8') as f:
+		for line_number, line in enumerate(f, 1):
+			line = line.strip()
+			if line == "" or line.startswith("#"):
+				continue
+			line_start = time.perf_counter()
+			try:
+				await run_console_line(interface, line)
+			except Exception as e:
+				errors += 1
+				print("Line " + str(line_number) + " failed: " + repr(e))
+			latencies.append(time.perf_counter() - line_start)
+	duration = time.perf_counter() - start
+	print("Ran %d lines in %.2f seconds, %.1f lines per second, %d failed." % (len(latencies), duration, len(latencies) / duration if duration > 0 else 0, errors))
+	if len(latencies) > 0:
+		print("Latency: p50 %.2f ms, p90 %.2f ms, p99 %.2f ms, max %.2f ms" % (1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.9), 1000 * percentile(latencies, 0.99), 1000 * max(latencies)))
 
 ### Discord Stuff ###
 
@@ -1177,12 +3910,14 @@ client = discord.Client()
 @client.event
 async def on_ready():
     print("Connected as user " + client.user.name + " with id " + client.user.id + ".")
+    command_metrics.start_dumping()
+    tick_scheduler.start()
 
 @client.event
 async def on_message(message):
 	if logging: log(message)
-	if message in ignore_messages:
-		ignore_messages.remove(message)
+	if pending_replies.deliver(message):
+		pass
 	elif client.user.id != message.author.id:
 		command_string = None
 		if message.content.startswith(bot_trigger):
@@ -1201,6 +3936,27 @@ def get_token():
 		return f.read().strip()
 
 if __name__ == "__main__":
-	init_world()
-	init_permissions()
-	client.run(get_token())
+	parser = argparse.ArgumentParser(description="Fridge Bot, the bot with fridges.")
+	parser.add_argument("--import-pickle", nargs="?", const=save_file, metavar="SAVE_FILE", help="copy a pickled Fridgeverse into " + database_file + " and exit")
+	parser.add_argument("--convert-pickle", nargs="?", const=save_file, metavar="SAVE_FILE", help="rewrite a pickled save file as a snapshot and exit")
+	parser.add_argument("--console", action="store_true", help="take commands from the terminal too while connected to discord")
+	parser.add_argument("--batch", metavar="FILE", help="run the commands in a file on the console without connecting to discord, and exit")
+	parser.add_argument("--quiet", action="store_true", help="don't print what the commands in a batch say")
+	arguments = parser.parse_args()
+	if arguments.import_pickle != None:
+		import_world(arguments.import_pickle)
+	elif arguments.convert_pickle != None:
+		convert_world(arguments.convert_pickle)
+	else:
+		init_world()
+		init_permissions()
+		try:
+			if arguments.batch != None:
+				asyncio.get_event_loop().run_until_complete(run_batch(arguments.batch, arguments.quiet))
+			else:
+				if arguments.console:
+					client.loop.create_task(console_interface_loop())
+				client.run(get_token())
+		finally:
+			persistence.flush()
+			message_logger.stop()
@@ -0,0 +1,236 @@
+#!/usr/bin/python3.5
+# Tests for saving Fridgeverse and loading it back after Fridge Bot is stopped
+# Each run of Fridge Bot happens in its own process in a temporary directory,
+# and is killed at the end instead of shutting down cleanly unless it says otherwise
+#
+# Usage: python3 -m unittest discover tests
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+repository = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# stands in for discord's channels and servers
+fakes = """
+import asyncio, os, sys
+import bot
+
+class FakeServer():
+	def __init__(self, id, name):
+		self.id = id
+		self.name = name
+
+	def __str__(self):
+		return self.name
+
+class FakeChannel(FakeServer):
+	def __init__(self, id, name, server):
+		super().__init__(id, name)
+		self.server = server
+		self.is_private = False
+
+server = FakeServer("s1", "server")
+channel = FakeChannel("c1", "random", server)
+other_channel = FakeChannel("c2", "general", server)
+bot.logging = False
+"""
+
+class PersistenceTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory(prefix="fridge-test-")
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	# the world is loaded before the script runs unless init is False
+	def run_bot(self, script, init=True):
+		environment = dict(os.environ)
+		environment["PYTHONPATH"] = os.pathsep.join([repository] + [path for path in [environment.get("PYTHONPATH")] if path])
+		if init:
+			script = "bot.init_world()\n" + textwrap.dedent(script)
+		result = subprocess.run([sys.executable, "-c", fakes + textwrap.dedent(script)], cwd=self.directory.name, env=environment, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=60)
+		self.assertEqual(result.returncode, 0, result.stdout)
+		return result.stdout
+
+	# load the world again and list every fridge of a channel and every thing with its id
+	def reload(self):
+		return self.run_bot("""
+			for depth, entity in bot.root_entity.walk():
+				print(entity.entity_id, entity.fridge_key, entity.entity_name, entity.quantity)
+			os._exit(0)
+		""").splitlines()
+
+	def test_changes_during_snapshot(self):
+		self.check_changes_during_snapshot(True)
+
+	def test_changes_during_threaded_snapshot(self):
+		self.check_changes_during_snapshot(False)
+
+	def check_changes_during_snapshot(self, fork):
+		self.run_bot("""
+			bot.snapshot_fork = %s
+			async def main():
+				fridge = bot.get_channel_fridge(channel)
+				fridge.put_into(bot.Entity("apple"))
+				task = asyncio.ensure_future(bot.persistence.snapshot())
+				await asyncio.sleep(0)
+				# a fridge is made while the snapshot is being taken, and saved by a later command
+				bot.get_channel_fridge(other_channel)
+				await task
+				bot.get_channel_fridge(other_channel).put_into(bot.Entity("banana"))
+				await bot.save_world()
+			asyncio.get_event_loop().run_until_complete(main())
+			os._exit(0)
+		""" % fork)
+		lines = self.reload()
+		self.assertEqual(len([line for line in lines if "('channel', 'c2')" in line]), 1, lines)
+		self.assertEqual(len([line for line in lines if "('channel', 'c1')" in line]), 1, lines)
+		self.assertEqual(len([line for line in lines if line.endswith(" apple 1")]), 1, lines)
+		self.assertEqual(len([line for line in lines if line.endswith(" banana 1")]), 1, lines)
+		ids = [line.split()[0] for line in lines]
+		self.assertEqual(len(ids), len(set(ids)), lines)
+
+	def test_journal_replayed_twice(self):
+		self.run_bot("""
+			async def main():
+				fridge = bot.get_channel_fridge(channel)
+				bag = bot.EntityBag()
+				fridge.put_into(bag)
+				fridge.put_into(bot.Entity("apple"))
+				await bot.save_world()
+				bag.put_into(fridge.get_entity("apple"))
+				await bot.save_world()
+			asyncio.get_event_loop().run_until_complete(main())
+			os._exit(0)
+		""")
+		before = self.reload()
+		# the journal going over the world again after it has already been replayed changes nothing
+		after = self.run_bot("""
+			bot.journal_sequence = 0
+			bot.replay_journal()
+			for depth, entity in bot.root_entity.walk():
+				print(entity.entity_id, entity.fridge_key, entity.entity_name, entity.quantity)
+			os._exit(0)
+		""").splitlines()
+		self.assertEqual(before, after)
+
+	def test_failed_snapshot_is_retried(self):
+		output = self.run_bot("""
+			bot.snapshot_retry_delay = 0
+			bot.max_save_staleness = 0
+			attempts = []
+			write_snapshot = bot.write_snapshot
+			def failing_write_snapshot(*args):
+				attempts.append(None)
+				if len(attempts) == 1:
+					raise OSError("disk full")
+				write_snapshot(*args)
+			bot.write_snapshot = failing_write_snapshot
+			bot.snapshot_fork = False
+			async def main():
+				bot.get_channel_fridge(channel).put_into(bot.Entity("apple"))
+				await bot.save_world()
+				while bot.persistence.saves == 0:
+					await asyncio.sleep(0.01)
+			asyncio.get_event_loop().run_until_complete(main())
+			print(len(attempts), bot.persistence.failed_saves, bot.persistence.saves)
+			os._exit(0)
+		""")
+		self.assertEqual(output.splitlines()[-1], "2 1 1", output)
+
+	def test_shutdown_during_snapshot(self):
+		self.run_bot("""
+			import time
+			write_snapshot = bot.write_snapshot
+			parent = os.getpid()
+			def slow_write_snapshot(*args):
+				if os.getpid() != parent:
+					time.sleep(1)
+				return write_snapshot(*args)
+			bot.write_snapshot = slow_write_snapshot
+			async def main():
+				bot.get_channel_fridge(channel).put_into(bot.Entity("apple"))
+				await bot.save_world()
+				bot.persistence.snapshot_task = asyncio.ensure_future(bot.persistence.snapshot())
+				await asyncio.sleep(0.1)
+				# saved while the snapshot process is still writing the world from before it
+				bot.get_channel_fridge(channel).put_into(bot.Entity("banana"))
+				await bot.save_world()
+			asyncio.get_event_loop().run_until_complete(main())
+			bot.persistence.flush()
+			# a snapshot process left behind would be done by now
+			time.sleep(1.5)
+			os._exit(0)
+		""")
+		lines = self.reload()
+		self.assertEqual(len([line for line in lines if line.endswith(" apple 1")]), 1, lines)
+		self.assertEqual(len([line for line in lines if line.endswith(" banana 1")]), 1, lines)
+
+	def test_failed_journal_write_is_retried(self):
+		self.run_bot("""
+			bot.journal_retry_delay = 0
+			attempts = []
+			append_journal = bot.append_journal
+			def failing_append_journal(entries, *args):
+				attempts.append(None)
+				if len(attempts) == 1:
+					raise OSError(28, "No space left on device")
+				append_journal(entries, *args)
+			bot.append_journal = failing_append_journal
+			async def main():
+				fridge = bot.get_channel_fridge(channel)
+				apples = bot.Entity("apple")
+				apples.quantity = 3
+				fridge.put_into(apples)
+				await bot.save_world()
+				fridge.move_many("apple", 1, bot.get_channel_fridge(other_channel))
+				await bot.save_world()
+			asyncio.get_event_loop().run_until_complete(main())
+			os._exit(0)
+		""")
+		lines = self.reload()
+		self.assertEqual(len([line for line in lines if line.endswith(" apple 2")]), 1, lines)
+		self.assertEqual(len([line for line in lines if line.endswith(" apple 1")]), 1, lines)
+
+	def test_journal_about_missing_entities(self):
+		self.run_bot("""
+			bot.append_journal([(bot.journal_sequence + 1, [("move_many", None, [(12345, 1, None, None)]), ("destroy", 12345)])])
+			os._exit(0)
+		""")
+		lines = self.reload()
+		self.assertTrue(any(line.endswith(" Fridgeverse 1") for line in lines), lines)
+
+	def test_pickles_are_only_loaded_when_converted(self):
+		self.run_bot("""
+			import pickle
+			apple = bot.Entity("apple")
+			apple.entity_id = 1000
+			with open(bot.save_file, "wb") as f:
+				pickle.dump({"root": bot.root_entity, "sequence": 0, "timers": []}, f)
+			with open(bot.journal_file, "wb") as f:
+				pickle.dump((1, [("create", bot.root_entity.entity_id, pickle.dumps(apple), 1000)]), f)
+			os._exit(0)
+		""")
+		output = self.run_bot("""
+			try:
+				bot.init_world()
+			except ValueError as e:
+				print(e)
+			os._exit(0)
+		""", False)
+		self.assertIn("--convert-pickle", output)
+		self.run_bot("""
+			bot.convert_world()
+			os._exit(0)
+		""", False)
+		lines = self.reload()
+		self.assertIn("1000 None apple 1", lines)
+		self.assertTrue(os.path.exists(os.path.join(self.directory.name, "fridgeverse.sav.pickle")))
+		self.assertTrue(os.path.exists(os.path.join(self.directory.name, "fridgeverse.journal.pickle")))
+
+if __name__ == "__main__":
+	unittest.main()